@@ -6,12 +6,22 @@ from pydantic import BaseModel
 from typing import List
 import google.generativeai as genai
 from dotenv import load_dotenv
+import logging
 import os
 import requests
+import sys
+
+# Shared modules such as logs.py live at the repository root
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from logs import RequestLoggingMiddleware, configure_logging, stage
 
 # Load environment variables
 load_dotenv()
 
+# JSON log lines through a background queue, tagged with the request ID
+configure_logging()
+logger = logging.getLogger(__name__)
+
 # Initialize FastAPI app
 app = FastAPI()
 
@@ -24,13 +34,24 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request IDs and per-stage timings; added last so it wraps everything else
+app.add_middleware(RequestLoggingMiddleware)
+
 # Configure Gemini API
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
 if not GEMINI_API_KEY:
     raise ValueError("Please set GEMINI_API_KEY or GOOGLE_API_KEY in your environment variables")
 
 genai.configure(api_key=GEMINI_API_KEY)
-model = genai.GenerativeModel('gemini-1.5-flash')
+
+# Model per endpoint; short chat questions use the cheaper fast model
+DEFAULT_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+model = genai.GenerativeModel(os.getenv("GEMINI_PLAN_MODEL") or DEFAULT_MODEL)
+legacy_model = genai.GenerativeModel(os.getenv("GEMINI_LEGACY_MODEL") or DEFAULT_MODEL)
+chat_model = genai.GenerativeModel(os.getenv("GEMINI_CHAT_MODEL") or DEFAULT_MODEL)
+fast_chat_model = genai.GenerativeModel(
+    os.getenv("GEMINI_CHAT_MODEL") or os.getenv("GEMINI_FAST_MODEL", "gemini-1.5-flash-8b"))
+CHAT_FAST_MAX_CHARS = int(os.getenv("CHAT_FAST_MAX_CHARS", 200))
 
 class TravelRequest(BaseModel):
     source: str
@@ -65,10 +86,11 @@ def get_flight_data(source, destination, start_date):
             "api_key": os.getenv("SERP_API_KEY")
         }
 
-        response = requests.get(url, params=params)
+        with stage("serpapi"):
+            response = requests.get(url, params=params)
         return response.json()
-    except Exception as e:
-        print(f"Error fetching flight data: {str(e)}")
+    except Exception:
+        logger.exception("Error fetching flight data")
         return None
 
 def format_flight_details_markdown(flight_data, source_code, dest_code, start_date):
@@ -165,7 +187,8 @@ async def generate_travel_plan(request: TravelRequest):
                 prompt += flight_context
 
         # Generate response using Gemini
-        response = model.generate_content(prompt)
+        with stage("gemini"):
+            response = model.generate_content(prompt)
 
         if flight_data:
             flight_data = format_flight_details_markdown(
@@ -187,6 +210,7 @@ async def generate_travel_plan(request: TravelRequest):
             "flight_details": flight_data if request.include_flights else None
         }
     except Exception as e:
+        logger.exception("Error in generate_travel_plan")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/chat")
@@ -204,12 +228,15 @@ async def chat_with_plan(request: ChatRequest):
         If the question is about something not covered in the plan, suggest relevant information or alternatives.
         """
 
-        response = model.generate_content(prompt)
+        routed_model = fast_chat_model if len(request.question) <= CHAT_FAST_MAX_CHARS else chat_model
+        with stage("gemini"):
+            response = routed_model.generate_content(prompt)
         return {
             "success": True,
             "response": response.text
         }
     except Exception as e:
+        logger.exception("Error in chat_with_plan")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/plan-trip")
@@ -240,7 +267,8 @@ async def plan_trip(request: TravelRequest):
         """
 
         # Generate response using Gemini
-        response = model.generate_content(prompt)
+        with stage("gemini"):
+            response = legacy_model.generate_content(prompt)
         
         return {
             "success": True,
@@ -248,6 +276,7 @@ async def plan_trip(request: TravelRequest):
         }
 
     except Exception as e:
+        logger.exception("Error in plan_trip")
         raise HTTPException(status_code=500, detail=str(e))
 
 # Mount the static files directory
@@ -0,0 +1,88 @@
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", 1000))
+
+_NON_WORD = re.compile(r"[^a-z0-9 ]+")
+_NEGATED = re.compile(r"n['’]t\b")
+# "what's", "we're", "I'll": the suffix is a stopword or carries no meaning
+_CONTRACTION = re.compile(r"['’](s|re|ll|m|ve|d)\b")
+
+# Words that do not change what a question asks. Negations are deliberately
+# absent: "not", "no" and "without" must match exactly.
+_STOPWORDS = frozenset("""
+    a an the is are was were be am do does did can could should would will shall may might must
+    i me my we us our you your it its this that these those there here what whats which who how
+    to of in on at for with about from by as and or if so any some please tell give
+""".split())
+
+
+def plan_fingerprint(travel_plan):
+    """Stable identifier for a plan's text"""
+    return hashlib.sha256(travel_plan.encode()).hexdigest()
+
+
+def normalize_question(question):
+    return " ".join(_NON_WORD.sub(" ", question.lower()).split())
+
+
+def content_words(question):
+    """The words that carry a question's meaning, including numbers and negations"""
+    text = _CONTRACTION.sub(" ", _NEGATED.sub(" not", question.lower()))
+    return frozenset(word for word in normalize_question(text).split() if word not in _STOPWORDS)
+
+
+class AnswerCache:
+    """Duplicate question cache for chat answers about the same plan
+
+    Questions are keyed by the plan fingerprint and their set of content
+    words, so rephrasings that only differ in filler words, word order,
+    punctuation or case share an answer ("cheapest transport?" and "What
+    is the cheapest transport"), while any changed number, negation or
+    other content word is a miss: "day 2" never answers "day 3" and "is it
+    safe" never answers "is it unsafe". The least recently used entry is
+    evicted when full.
+    """
+
+    def __init__(self, max_entries=ANSWER_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (fingerprint, content words) -> answer, in LRU order
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, fingerprint, question):
+        """Cached answer to an equivalent question about the same plan, or None"""
+        key = (fingerprint, content_words(question))
+        with self._lock:
+            # A question made only of filler words is too vague to share
+            answer = self._entries.get(key) if key[1] else None
+            if answer is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return answer
+
+    def store(self, fingerprint, question, answer):
+        key = (fingerprint, content_words(question))
+        if not key[1]:
+            return
+        with self._lock:
+            self._entries[key] = answer
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
@@ -1,22 +1,34 @@
 from http.server import BaseHTTPRequestHandler
 import json
+import logging
 import os
+import sys
 import google.generativeai as genai
 
+# Shared modules such as logs.py live at the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from logs import configure_logging, new_request_id, request_id
+
+# JSON log lines through a background queue, tagged with the request ID
+configure_logging()
+logger = logging.getLogger(__name__)
+
 # Initialize Gemini
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY")
 if GEMINI_API_KEY:
     try:
         genai.configure(api_key=GEMINI_API_KEY)
-        model = genai.GenerativeModel('gemini-1.5-flash')
-    except Exception as e:
-        print(f"Error configuring Gemini: {e}")
+        model = genai.GenerativeModel(
+            os.environ.get("GEMINI_PLAN_MODEL") or os.environ.get("GEMINI_MODEL", "gemini-1.5-flash"))
+    except Exception:
+        logger.exception("Error configuring Gemini")
         model = None
 else:
     model = None
 
 class handler(BaseHTTPRequestHandler):
     def do_POST(self):
+        request_id.set(new_request_id(self.headers.get("x-request-id") or self.headers.get("x-vercel-id")))
         try:
             if not model:
                 self.send_error_response(500, "Gemini AI is not configured. Please set GEMINI_API_KEY environment variable.")
@@ -88,6 +100,7 @@ Format the response in markdown for better readability.
         except json.JSONDecodeError:
             self.send_error_response(400, "Invalid JSON")
         except Exception as e:
+            logger.exception("Error generating travel plan")
             self.send_error_response(500, f"Error generating travel plan: {str(e)}")
 
     def do_OPTIONS(self):
@@ -1,20 +1,37 @@
 from http.server import BaseHTTPRequestHandler
 import json
+import logging
 import os
+import sys
 import urllib.parse
 import google.generativeai as genai
 
+# Shared modules such as logs.py live at the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from logs import configure_logging, new_request_id, request_id
+
+# JSON log lines through a background queue, tagged with the request ID
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# Model tiers: short chat questions use the fast model
+DEFAULT_MODEL = os.environ.get("GEMINI_MODEL", "gemini-1.5-flash")
+FAST_MODEL = os.environ.get("GEMINI_FAST_MODEL", "gemini-1.5-flash-8b")
+CHAT_FAST_MAX_CHARS = int(os.environ.get("CHAT_FAST_MAX_CHARS", 200))
+
 # Initialize Gemini
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY")
 if GEMINI_API_KEY:
     try:
         genai.configure(api_key=GEMINI_API_KEY)
-        model = genai.GenerativeModel('gemini-1.5-flash')
-    except Exception as e:
-        print(f"Error configuring Gemini: {e}")
-        model = None
+        model = genai.GenerativeModel(os.environ.get("GEMINI_PLAN_MODEL") or DEFAULT_MODEL)
+        chat_model = genai.GenerativeModel(os.environ.get("GEMINI_CHAT_MODEL") or DEFAULT_MODEL)
+        fast_chat_model = genai.GenerativeModel(os.environ.get("GEMINI_CHAT_MODEL") or FAST_MODEL)
+    except Exception:
+        logger.exception("Error configuring Gemini")
+        model = chat_model = fast_chat_model = None
 else:
-    model = None
+    model = chat_model = fast_chat_model = None
 
 class handler(BaseHTTPRequestHandler):
     def do_OPTIONS(self):
@@ -48,6 +65,7 @@ class handler(BaseHTTPRequestHandler):
 
     def do_POST(self):
         """Handle POST requests"""
+        request_id.set(new_request_id(self.headers.get("x-request-id") or self.headers.get("x-vercel-id")))
         try:
             content_length = int(self.headers.get('Content-Length', 0))
             if content_length > 0:
@@ -68,6 +86,7 @@ class handler(BaseHTTPRequestHandler):
         except json.JSONDecodeError:
             self.send_error_response(400, "Invalid JSON")
         except Exception as e:
+            logger.exception("Server error")
             self.send_error_response(500, f"Server error: {str(e)}")
 
     def handle_generate_plan(self, data):
@@ -133,6 +152,7 @@ Format the response in markdown for better readability.
             })
 
         except Exception as e:
+            logger.exception("Error generating travel plan")
             self.send_error_response(500, f"Error generating travel plan: {str(e)}")
 
     def handle_chat(self, data):
@@ -160,7 +180,8 @@ Provide a clear and concise response, using markdown formatting where appropriat
 If the question is about something not covered in the plan, suggest relevant information or alternatives.
 """
 
-            response = model.generate_content(prompt)
+            routed_model = fast_chat_model if len(question) <= CHAT_FAST_MAX_CHARS else chat_model
+            response = routed_model.generate_content(prompt)
             
             if not response or not response.text:
                 self.send_error_response(500, "Failed to generate response")
@@ -172,6 +193,7 @@ If the question is about something not covered in the plan, suggest relevant inf
             })
 
         except Exception as e:
+            logger.exception("Error in chat")
             self.send_error_response(500, f"Error in chat: {str(e)}")
 
     def send_json_response(self, data, status_code=200):
@@ -0,0 +1,113 @@
+import os
+import threading
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because its circuit breaker is open"""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name} is temporarily unavailable")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Fail fast on an upstream that keeps failing, then probe it for recovery
+
+    The breaker opens after ``failure_threshold`` consecutive failures. While
+    open, every call is rejected immediately. After ``reset_timeout`` seconds
+    it goes half-open and lets up to ``half_open_max_calls`` probe requests
+    through; a successful probe closes it again, a failed one re-opens it.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0, half_open_max_calls=1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._rejected = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._probes = 0
+        return self._state
+
+    def _retry_after(self):
+        return max(self.reset_timeout - (time.monotonic() - self._opened_at), 0.0)
+
+    def before_call(self):
+        """Reserve a call slot, raising CircuitOpenError if none is available"""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return
+            if state == HALF_OPEN and self._probes < self.half_open_max_calls:
+                self._probes += 1
+                return
+            self._rejected += 1
+            raise CircuitOpenError(self.name, self._retry_after())
+
+    def allow_request(self):
+        """Whether a call would currently be let through, without reserving it"""
+        with self._lock:
+            state = self._current_state()
+            return state == CLOSED or (state == HALF_OPEN and self._probes < self.half_open_max_calls)
+
+    def record_success(self):
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._probes = 0
+
+    def release(self):
+        """Give back a reserved slot whose call ended without an outcome, e.g. was cancelled"""
+        with self._lock:
+            if self._state == HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._probes = 0
+
+    def snapshot(self):
+        """Current breaker state for health reporting"""
+        with self._lock:
+            state = self._current_state()
+            return {
+                "state": state,
+                "consecutive_failures": self._failures,
+                "failure_threshold": self.failure_threshold,
+                "reset_timeout_seconds": self.reset_timeout,
+                "retry_after_seconds": round(self._retry_after(), 1) if state == OPEN else 0.0,
+                "rejected_calls": self._rejected,
+            }
+
+
+def breaker_from_env(name, prefix, failure_threshold=5, reset_timeout=30.0):
+    """Build a breaker whose thresholds can be overridden with <PREFIX>_BREAKER_* env vars"""
+    return CircuitBreaker(
+        name,
+        failure_threshold=int(os.environ.get(f"{prefix}_BREAKER_FAILURE_THRESHOLD", failure_threshold)),
+        reset_timeout=float(os.environ.get(f"{prefix}_BREAKER_RESET_SECONDS", reset_timeout)),
+        half_open_max_calls=int(os.environ.get(f"{prefix}_BREAKER_HALF_OPEN_CALLS", 1)),
+    )
@@ -0,0 +1,59 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Bounded in-memory LRU cache whose entries expire after a fixed TTL
+
+    Expired entries are kept until evicted so callers can still fall back to
+    a stale value when the upstream that produces it is unavailable.
+    """
+
+    def __init__(self, max_entries=256, ttl_seconds=3600.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, allow_stale=False):
+        """Return the cached value for ``key`` or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            stored_at, value = entry
+            if not allow_stale and time.monotonic() - stored_at > self.ttl_seconds:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def age(self, key):
+        """Seconds since ``key`` was stored, or None if it is not cached"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return None if entry is None else time.monotonic() - entry[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
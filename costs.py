@@ -0,0 +1,176 @@
+import math
+import re
+from datetime import date
+
+import numpy as np
+
+from locations import AIRPORTS, resolve_location
+
+# Cost categories, in the column order used by the rate tables below
+COST_CATEGORIES = ["Accommodation", "Food", "Local Transport"]
+
+# Comfort tiers, in the row order used by the rate tables below
+COST_TIERS = ["Budget", "Mid-range", "Luxury"]
+
+# Daily rates in INR per destination, shape (tier, category).
+# Accommodation is per room (2 travelers), food and transport are per person.
+DAILY_RATES = {
+    "goa": [[1500, 600, 400], [4500, 1200, 900], [12000, 3000, 2500]],
+    "delhi": [[1200, 500, 300], [4000, 1100, 800], [11000, 2800, 2200]],
+    "mumbai": [[1800, 600, 400], [5500, 1300, 900], [15000, 3200, 2500]],
+    "bangalore": [[1400, 500, 350], [4500, 1100, 800], [12000, 2800, 2200]],
+    "chennai": [[1200, 450, 300], [4000, 1000, 700], [10000, 2500, 2000]],
+    "kolkata": [[1000, 400, 250], [3500, 900, 600], [9000, 2400, 1800]],
+    "hyderabad": [[1200, 450, 300], [4000, 1000, 700], [10000, 2500, 2000]],
+    "jaipur": [[1000, 450, 300], [3500, 1000, 700], [12000, 2800, 2200]],
+    "kerala": [[1300, 500, 400], [4500, 1100, 900], [13000, 2800, 2500]],
+    "manali": [[1100, 500, 500], [3800, 1000, 1200], [10000, 2500, 3000]],
+    "dubai": [[4500, 1500, 800], [11000, 3500, 2000], [30000, 8000, 5000]],
+    "singapore": [[5000, 1500, 700], [12000, 3500, 1500], [32000, 8000, 4000]],
+    "bangkok": [[2000, 800, 500], [5000, 1800, 1200], [15000, 4500, 3000]],
+    "bali": [[2000, 800, 700], [5500, 1800, 1500], [18000, 4500, 3500]],
+    "london": [[9000, 3000, 1500], [20000, 6000, 2500], [50000, 12000, 6000]],
+    "paris": [[8500, 3000, 1400], [19000, 6000, 2400], [48000, 12000, 6000]],
+    "new york": [[12000, 3500, 1500], [25000, 7000, 2500], [60000, 14000, 7000]],
+}
+
+# Fallback rates for destinations missing from the table
+DEFAULT_DAILY_RATES = [[2500, 800, 500], [6000, 1800, 1200], [18000, 4500, 3000]]
+
+# Airport codes (see locations.py) mapped to table keys; city names and
+# their alternate spellings resolve to these codes first
+AIRPORT_RATES = {
+    "GOI": "goa",
+    "DEL": "delhi",
+    "BOM": "mumbai",
+    "BLR": "bangalore",
+    "MAA": "chennai",
+    "CCU": "kolkata",
+    "HYD": "hyderabad",
+    "JAI": "jaipur",
+    "COK": "kerala",
+    "TRV": "kerala",
+    "KUU": "manali",
+    "DXB": "dubai",
+    "SIN": "singapore",
+    "BKK": "bangkok",
+    "DPS": "bali",
+    "LHR": "london",
+    "CDG": "paris",
+    "JFK": "new york",
+}
+
+# Table keys that are regions rather than an airport's city, e.g. "kerala"
+_REGION_KEYS = [key for key in DAILY_RATES if key not in {AIRPORTS[code].lower() for code in AIRPORT_RATES}]
+
+_DEFAULT_KEY = "default"
+_RATE_KEYS = list(DAILY_RATES) + [_DEFAULT_KEY]
+_RATE_INDEX = {key: i for i, key in enumerate(_RATE_KEYS)}
+
+# All rate tables stacked into one array of shape (destination, tier, category)
+_RATE_TABLE = np.array(
+    [DAILY_RATES[key] for key in DAILY_RATES] + [DEFAULT_DAILY_RATES],
+    dtype=np.float64,
+)
+
+# Room sharing: accommodation scales by rooms, everything else by people
+_TRAVELERS_PER_ROOM = 2
+
+
+def resolve_destination(destination, destination_code=None):
+    """Map a destination, preferably by its airport code, to a rate table key"""
+    if destination_code is None:
+        resolved = resolve_location(destination)
+        destination_code = resolved[1] if resolved else None
+    if destination_code in AIRPORT_RATES:
+        return AIRPORT_RATES[destination_code]
+
+    # Places inside a region, such as "Munnar, Kerala"; whole words only
+    text = str(destination).lower()
+    for name in _REGION_KEYS:
+        if re.search(rf"\b{re.escape(name)}\b", text):
+            return name
+    return _DEFAULT_KEY
+
+
+def trip_days(start_date, end_date):
+    """Number of days in the trip, counting both ends, never less than 1"""
+    try:
+        start = date.fromisoformat(str(start_date))
+        end = date.fromisoformat(str(end_date))
+    except ValueError:
+        return 1
+    return max((end - start).days + 1, 1)
+
+
+def estimate_costs(destination, start_date, end_date, travelers, budget, destination_code=None):
+    """Compute a deterministic cost breakdown for a trip in INR"""
+    travelers = max(int(travelers), 1)
+    days = trip_days(start_date, end_date)
+    key = resolve_destination(destination, destination_code)
+    rates = _RATE_TABLE[_RATE_INDEX[key]]
+
+    # Units each daily rate is multiplied by: rooms for lodging, people otherwise
+    rooms = math.ceil(travelers / _TRAVELERS_PER_ROOM)
+    units = np.array([rooms, travelers, travelers], dtype=np.float64)
+
+    # Every tier at once, shape (tier, category)
+    costs = rates * units * days
+    totals = costs.sum(axis=1)
+
+    # Most comfortable tier that fits the budget, otherwise the cheapest one
+    affordable = np.flatnonzero(totals <= budget)
+    tier = int(affordable[-1]) if affordable.size else 0
+
+    breakdown = {
+        category: int(round(amount))
+        for category, amount in zip(COST_CATEGORIES, costs[tier])
+    }
+    total = int(round(totals[tier]))
+
+    return {
+        "destination": key if key != _DEFAULT_KEY else None,
+        "days": days,
+        "travelers": travelers,
+        "tier": COST_TIERS[tier],
+        "breakdown": breakdown,
+        "total": total,
+        "budget": budget,
+        "remaining": int(round(budget - totals[tier])),
+        "tier_totals": {
+            name: int(round(amount)) for name, amount in zip(COST_TIERS, totals)
+        },
+    }
+
+
+def format_costs_markdown(costs):
+    """Format a cost estimate into a markdown section"""
+    markdown = "## Estimated Costs Breakdown\n\n"
+    markdown += (
+        f"*{costs['tier']} estimate for {costs['travelers']} traveler(s) "
+        f"over {costs['days']} day(s)*\n\n"
+    )
+    markdown += "| Category | Estimated Cost |\n"
+    markdown += "|----------|----------------|\n"
+    for category, amount in costs["breakdown"].items():
+        markdown += f"| {category} | ₹{amount:,} |\n"
+    markdown += f"| **Total** | **₹{costs['total']:,}** |\n\n"
+
+    if costs["remaining"] >= 0:
+        markdown += f"Remaining from your ₹{costs['budget']:,.0f} budget for flights, activities and shopping: ₹{costs['remaining']:,}\n"
+    else:
+        markdown += f"This estimate exceeds your ₹{costs['budget']:,.0f} budget by ₹{-costs['remaining']:,}. Consider fewer days or a cheaper destination.\n"
+    return markdown
+
+
+def format_costs_prompt(costs):
+    """Summarize a cost estimate as fixed facts for the Gemini prompt"""
+    lines = [
+        f"- Comfort level: {costs['tier']}",
+        f"- Trip length: {costs['days']} day(s)",
+    ]
+    for category, amount in costs["breakdown"].items():
+        lines.append(f"- {category}: ₹{amount}")
+    lines.append(f"- Total for stay, food and local transport: ₹{costs['total']}")
+    lines.append(f"- Remaining budget: ₹{costs['remaining']}")
+    return "\n".join(lines)
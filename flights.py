@@ -0,0 +1,138 @@
+import math
+import os
+
+import numpy as np
+
+FLIGHT_PAGE_SIZE = int(os.environ.get("FLIGHT_PAGE_SIZE", 20))
+FLIGHT_MAX_PAGE_SIZE = 100
+
+SORT_COLUMNS = ("price", "duration", "stops", "departure")
+# Joins the carriers of a multi-segment option in its "airline" field
+AIRLINE_SEPARATOR = " / "
+
+
+def minutes_of_day(value):
+    """Minutes after midnight for "HH:MM" or SerpAPI's "YYYY-MM-DD HH:MM", or NaN"""
+    try:
+        hours, minutes = value.split()[-1].split(":")
+        return int(hours) * 60 + int(minutes)
+    except (AttributeError, ValueError):
+        return math.nan
+
+
+def _number(value):
+    return float(value) if isinstance(value, (int, float)) else math.nan
+
+
+def summarize_option(option, best):
+    """The fields the UI shows for one SerpAPI flight option"""
+    segments = option.get("flights") or [{}]
+    first, last = segments[0], segments[-1]
+    airlines = list(dict.fromkeys(s["airline"] for s in segments if s.get("airline")))
+    return {
+        "airline": AIRLINE_SEPARATOR.join(airlines) or None,
+        "flight_numbers": [s["flight_number"] for s in segments if s.get("flight_number")],
+        "departure_airport": (first.get("departure_airport") or {}).get("id"),
+        "departure_time": (first.get("departure_airport") or {}).get("time"),
+        "arrival_airport": (last.get("arrival_airport") or {}).get("id"),
+        "arrival_time": (last.get("arrival_airport") or {}).get("time"),
+        "duration_minutes": option.get("total_duration"),
+        "stops": len(segments) - 1,
+        "layovers": [layover.get("id") or layover.get("name") for layover in option.get("layovers") or []],
+        "travel_class": first.get("travel_class"),
+        "price": option.get("price"),
+        "best": best,
+    }
+
+
+class FlightTable:
+    """Column-oriented view of one cached flight search
+
+    Options from both ``best_flights`` and ``other_flights`` are loaded into
+    NumPy columns once. A query is a boolean mask plus a sort over those
+    columns, and only the requested page is turned back into dicts, so
+    re-sorting or filtering hundreds of options costs no further searches.
+    Missing prices, durations and times are NaN: they never pass a filter
+    on that column and sort last.
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.price = np.array([_number(r["price"]) for r in rows], dtype=np.float64)
+        self.duration = np.array([_number(r["duration_minutes"]) for r in rows], dtype=np.float64)
+        self.stops = np.array([r["stops"] for r in rows], dtype=np.float64)
+        self.departure = np.array([minutes_of_day(r["departure_time"]) for r in rows], dtype=np.float64)
+        # One column per carrier, True where any segment of the option flies it
+        carriers = [r["airline"].split(AIRLINE_SEPARATOR) if r["airline"] else [] for r in rows]
+        self.airlines = sorted({name for names in carriers for name in names})
+        self._airline_codes = {name.lower(): i for i, name in enumerate(self.airlines)}
+        self.airline = np.zeros((len(rows), len(self.airlines)), dtype=bool)
+        for i, names in enumerate(carriers):
+            self.airline[i, [self._airline_codes[name.lower()] for name in names]] = True
+
+    @classmethod
+    def from_serpapi(cls, flight_data):
+        rows = [summarize_option(option, True) for option in flight_data.get("best_flights") or []]
+        rows += [summarize_option(option, False) for option in flight_data.get("other_flights") or []]
+        return cls(rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def price_summary(self):
+        """Cheapest and median fare across all options, for comparing dates"""
+        priced = np.flatnonzero(~np.isnan(self.price))
+        if not priced.size:
+            return {"options": len(self.rows), "min_price": None, "median_price": None, "cheapest_airline": None}
+        cheapest = priced[np.argmin(self.price[priced])]
+        return {
+            "options": len(self.rows),
+            "min_price": float(self.price[cheapest]),
+            "median_price": float(np.median(self.price[priced])),
+            "cheapest_airline": self.rows[cheapest]["airline"],
+        }
+
+    def query(self, sort="price", descending=False, max_price=None, max_stops=None, max_duration=None,
+              airlines=None, depart_after=None, depart_before=None, offset=0, limit=FLIGHT_PAGE_SIZE):
+        """One page of matching options plus the facets needed to build filters
+
+        ``depart_after`` and ``depart_before`` are minutes after midnight.
+        """
+        if sort not in SORT_COLUMNS:
+            raise ValueError(f"sort must be one of {', '.join(SORT_COLUMNS)}")
+
+        mask = np.ones(len(self.rows), dtype=bool)
+        if max_price is not None:
+            mask &= self.price <= max_price
+        if max_stops is not None:
+            mask &= self.stops <= max_stops
+        if max_duration is not None:
+            mask &= self.duration <= max_duration
+        if airlines:
+            wanted = [self._airline_codes[a.lower()] for a in airlines if a.lower() in self._airline_codes]
+            mask &= self.airline[:, wanted].any(axis=1)
+        if depart_after is not None:
+            mask &= self.departure >= depart_after
+        if depart_before is not None:
+            mask &= self.departure <= depart_before
+        matches = np.flatnonzero(mask)
+
+        keys = getattr(self, sort)[matches]
+        if descending:
+            keys = -keys
+        prices = self.price[matches]
+        # lexsort sorts by the last key first; NaN becomes +inf so it sorts last
+        order = matches[np.lexsort((np.nan_to_num(prices, nan=np.inf), np.nan_to_num(keys, nan=np.inf)))]
+        page = order[offset:offset + limit]
+
+        priced = prices[~np.isnan(prices)]
+        return {
+            "total": int(matches.size),
+            "offset": offset,
+            "limit": limit,
+            "sort": sort,
+            "order": "desc" if descending else "asc",
+            "flights": [self.rows[i] for i in page],
+            "airlines": self.airlines,
+            "price_range": [float(priced.min()), float(priced.max())] if priced.size else None,
+        }
@@ -0,0 +1,118 @@
+import asyncio
+import os
+
+from fastapi import WebSocketDisconnect
+
+# Application-level heartbeat; a client that stays silent for longer than
+# WS_IDLE_TIMEOUT_SECONDS is considered gone
+WS_HEARTBEAT_SECONDS = float(os.environ.get("WS_HEARTBEAT_SECONDS", 20))
+WS_IDLE_TIMEOUT_SECONDS = float(os.environ.get("WS_IDLE_TIMEOUT_SECONDS", 60))
+# Messages buffered for a slow client, and how long to wait for room before giving up
+WS_OUTBOX_SIZE = int(os.environ.get("WS_OUTBOX_SIZE", 64))
+WS_SEND_TIMEOUT_SECONDS = float(os.environ.get("WS_SEND_TIMEOUT_SECONDS", 30))
+WS_INBOX_SIZE = 8
+
+
+class SlowConsumerError(Exception):
+    """The client stopped reading and its outbox stayed full"""
+
+
+class LiveConnection:
+    """Outgoing side of one WebSocket session
+
+    Messages go through a bounded outbox drained by a single writer task, so
+    a slow client pushes back on whoever is producing (``send`` waits for
+    room) instead of growing memory without limit. Streamed text should be
+    sent with ``send_stream``, which merges everything that piled up while
+    the client was not reading into one message.
+    """
+
+    def __init__(self, websocket, outbox_size=WS_OUTBOX_SIZE, send_timeout=WS_SEND_TIMEOUT_SECONDS,
+                 heartbeat_seconds=WS_HEARTBEAT_SECONDS, idle_timeout=WS_IDLE_TIMEOUT_SECONDS):
+        self.websocket = websocket
+        self.send_timeout = send_timeout
+        self.heartbeat_seconds = heartbeat_seconds
+        self.idle_timeout = idle_timeout
+        self.outbox = asyncio.Queue(maxsize=outbox_size)
+        # Requests waiting behind the one being handled; when full, reading pauses
+        self.inbox = asyncio.Queue(maxsize=WS_INBOX_SIZE)
+        self.closed = asyncio.Event()
+        self.last_received = asyncio.get_running_loop().time()
+
+    async def send(self, message):
+        if self.closed.is_set():
+            raise WebSocketDisconnect()
+        try:
+            await asyncio.wait_for(self.outbox.put(message), self.send_timeout)
+        except asyncio.TimeoutError:
+            self.closed.set()
+            raise SlowConsumerError()
+
+    async def send_stream(self, message_type, chunks):
+        """Send text from the ``chunks`` queue until it yields None; returns the full text"""
+        parts = []
+        done = False
+        while not done:
+            pending = [await chunks.get()]
+            # Coalesce whatever arrived while we were waiting on the client
+            while not chunks.empty():
+                pending.append(chunks.get_nowait())
+            if None in pending:
+                pending = pending[:pending.index(None)]
+                done = True
+            text = "".join(pending)
+            if text:
+                parts.append(text)
+                await self.send({"type": message_type, "text": text})
+        return "".join(parts)
+
+    async def run_reader(self):
+        """Queue client requests on ``inbox``; a None marks the end of the connection
+
+        Reading continues while a request is being handled, so heartbeats
+        keep flowing during a long generation.
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    message = await self.websocket.receive_json()
+                except (ValueError, KeyError):
+                    # Invalid JSON, or a binary frame, which has no text to decode
+                    await self.send({"type": "error", "detail": "Messages must be JSON objects"})
+                    continue
+                self.last_received = loop.time()
+                if not isinstance(message, dict):
+                    await self.send({"type": "error", "detail": "Messages must be JSON objects"})
+                elif message.get("type") == "ping":
+                    await self.send({"type": "pong"})
+                elif message.get("type") != "pong":
+                    await self.inbox.put(message)
+        except (WebSocketDisconnect, SlowConsumerError, RuntimeError):
+            pass
+        finally:
+            self.closed.set()
+            # Nothing queued can be answered any more
+            while not self.inbox.empty():
+                self.inbox.get_nowait()
+            self.inbox.put_nowait(None)
+
+    async def run_writer(self):
+        try:
+            while True:
+                message = await self.outbox.get()
+                await self.websocket.send_json(message)
+        finally:
+            self.closed.set()
+
+    async def run_heartbeat(self):
+        loop = asyncio.get_running_loop()
+        while not self.closed.is_set():
+            await asyncio.sleep(self.heartbeat_seconds)
+            if loop.time() - self.last_received > self.idle_timeout:
+                self.closed.set()
+                await self.websocket.close(code=1001)
+                return
+            # Skip the ping when the client is not keeping up anyway
+            if not self.outbox.full():
+                self.outbox.put_nowait({"type": "ping"})
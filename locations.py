@@ -0,0 +1,204 @@
+import difflib
+import re
+
+# Offline airport table: IATA code -> city name
+AIRPORTS = {
+    # India
+    "DEL": "Delhi",
+    "BOM": "Mumbai",
+    "BLR": "Bangalore",
+    "MAA": "Chennai",
+    "CCU": "Kolkata",
+    "HYD": "Hyderabad",
+    "GOI": "Goa",
+    "COK": "Kochi",
+    "TRV": "Thiruvananthapuram",
+    "JAI": "Jaipur",
+    "AMD": "Ahmedabad",
+    "PNQ": "Pune",
+    "LKO": "Lucknow",
+    "ATQ": "Amritsar",
+    "IXC": "Chandigarh",
+    "SXR": "Srinagar",
+    "IXL": "Leh",
+    "KUU": "Manali",
+    "VNS": "Varanasi",
+    "PAT": "Patna",
+    "BBI": "Bhubaneswar",
+    "GAU": "Guwahati",
+    "IXB": "Bagdogra",
+    "IXZ": "Port Blair",
+    "UDR": "Udaipur",
+    "JDH": "Jodhpur",
+    "IDR": "Indore",
+    "NAG": "Nagpur",
+    "CJB": "Coimbatore",
+    "IXE": "Mangalore",
+    "IXM": "Madurai",
+    "VTZ": "Visakhapatnam",
+    "DED": "Dehradun",
+    # International
+    "DXB": "Dubai",
+    "AUH": "Abu Dhabi",
+    "DOH": "Doha",
+    "SIN": "Singapore",
+    "BKK": "Bangkok",
+    "HKT": "Phuket",
+    "KUL": "Kuala Lumpur",
+    "DPS": "Bali",
+    "CMB": "Colombo",
+    "MLE": "Male",
+    "KTM": "Kathmandu",
+    "HKG": "Hong Kong",
+    "NRT": "Tokyo",
+    "ICN": "Seoul",
+    "SYD": "Sydney",
+    "MEL": "Melbourne",
+    "LHR": "London",
+    "CDG": "Paris",
+    "FRA": "Frankfurt",
+    "AMS": "Amsterdam",
+    "FCO": "Rome",
+    "ZRH": "Zurich",
+    "IST": "Istanbul",
+    "JFK": "New York",
+    "SFO": "San Francisco",
+    "LAX": "Los Angeles",
+    "ORD": "Chicago",
+    "YYZ": "Toronto",
+}
+
+# Alternate spellings mapped to IATA codes
+CITY_ALIASES = {
+    "new delhi": "DEL",
+    "bombay": "BOM",
+    "bengaluru": "BLR",
+    "madras": "MAA",
+    "calcutta": "CCU",
+    "cochin": "COK",
+    "trivandrum": "TRV",
+    "kullu": "KUU",
+    "benares": "VNS",
+    "vizag": "VTZ",
+    "darjeeling": "IXB",
+    "andaman": "IXZ",
+    "ladakh": "IXL",
+    "kashmir": "SXR",
+    "denpasar": "DPS",
+    "maldives": "MLE",
+    "nyc": "JFK",
+}
+
+# Countries of the international airports above; every other code is in India
+AIRPORT_COUNTRIES = {
+    "DXB": "uae", "AUH": "uae", "DOH": "qatar", "SIN": "singapore", "BKK": "thailand",
+    "HKT": "thailand", "KUL": "malaysia", "DPS": "indonesia", "CMB": "sri lanka",
+    "MLE": "maldives", "KTM": "nepal", "HKG": "hong kong", "NRT": "japan",
+    "ICN": "south korea", "SYD": "australia", "MEL": "australia", "LHR": "uk",
+    "CDG": "france", "FRA": "germany", "AMS": "netherlands", "FCO": "italy",
+    "ZRH": "switzerland", "IST": "turkey", "JFK": "usa", "SFO": "usa", "LAX": "usa",
+    "ORD": "usa", "YYZ": "canada",
+}
+
+# Country names accepted after a city ("Goa, India"), mapped to the names above
+COUNTRY_NAMES = {
+    "india": "india", "uae": "uae", "united arab emirates": "uae", "qatar": "qatar",
+    "singapore": "singapore", "thailand": "thailand", "malaysia": "malaysia",
+    "indonesia": "indonesia", "sri lanka": "sri lanka", "maldives": "maldives",
+    "nepal": "nepal", "hong kong": "hong kong", "japan": "japan", "korea": "south korea",
+    "south korea": "south korea", "australia": "australia", "uk": "uk",
+    "united kingdom": "uk", "england": "uk", "france": "france", "germany": "germany",
+    "netherlands": "netherlands", "italy": "italy", "switzerland": "switzerland",
+    "turkey": "turkey", "turkiye": "turkey", "usa": "usa", "us": "usa",
+    "united states": "usa", "canada": "canada",
+}
+
+_CITY_INDEX = {city.lower(): code for code, city in AIRPORTS.items()}
+_CITY_INDEX.update(CITY_ALIASES)
+_CITY_NAMES = list(_CITY_INDEX)
+
+# Minimum difflib similarity for a "did you mean" suggestion
+FUZZY_CUTOFF = 0.8
+
+_IATA_CODE = re.compile(r"[A-Z]{3}")
+
+
+def _clean(text):
+    return " ".join(str(text).replace(",", " ").split())
+
+
+def resolve_location(text):
+    """Resolve a city name or IATA code to ``(city, code)``, or None if unknown
+
+    Accepts codes ("goi"), names ("New Delhi") and names with a country or
+    code ("Goa, India", "Goa (GOI)"). Only exact matches count: a real city
+    missing from the table must not be swapped for a similar-looking one, so
+    anything else after the name ("Paris, Texas") makes the place unknown.
+    """
+    cleaned = _clean(text)
+    if not cleaned:
+        return None
+
+    # "Goa (GOI)" style input: the code decides, not the name
+    if cleaned.endswith(")") and "(" in cleaned:
+        code = cleaned[cleaned.rindex("(") + 1:-1].strip().upper()
+        if code in AIRPORTS:
+            return AIRPORTS[code], code
+        return None
+
+    if cleaned.upper() in AIRPORTS:
+        code = cleaned.upper()
+        return AIRPORTS[code], code
+
+    name = cleaned.lower()
+    if name in _CITY_INDEX:
+        code = _CITY_INDEX[name]
+        return AIRPORTS[code], code
+
+    # Otherwise only a trailing country is dropped, and it must be the city's own
+    words = name.split()
+    for end in range(len(words) - 1, 0, -1):
+        country = COUNTRY_NAMES.get(" ".join(words[end:]))
+        code = _CITY_INDEX.get(" ".join(words[:end]))
+        if country and code and AIRPORT_COUNTRIES.get(code, "india") == country:
+            return AIRPORTS[code], code
+    return None
+
+
+def suggest_location(text):
+    """Closest known ``(city, code)`` to a misspelled name, or None; never applied automatically"""
+    match = difflib.get_close_matches(_clean(text).lower(), _CITY_NAMES, n=1, cutoff=FUZZY_CUTOFF)
+    if not match:
+        return None
+    code = _CITY_INDEX[match[0]]
+    return AIRPORTS[code], code
+
+
+def normalize_location(text):
+    """Canonical ``(city, code)`` for known places, ``(title-cased text, None)`` otherwise
+
+    IATA codes missing from the table are passed through so flight searches
+    work for any airport, but only when clearly meant as a code: typed in
+    upper case ("SEA") or in parentheses ("Seattle (SEA)"). "Rio" stays a
+    place name.
+    """
+    resolved = resolve_location(text)
+    if resolved:
+        return resolved
+    typed = " ".join(str(text).split())
+    if _IATA_CODE.fullmatch(typed):
+        return typed, typed
+    if typed.endswith(")") and "(" in typed:
+        name, code = typed[:typed.rindex("(")].strip(), typed[typed.rindex("(") + 1:-1].strip().upper()
+        if _IATA_CODE.fullmatch(code):
+            return (name.title() or code), code
+    return typed.title(), None
+
+
+def unknown_airport_message(field, text):
+    """Validation message for a location that has no airport code"""
+    message = f"Unknown airport for {field}; use a known city name or an upper-case IATA code such as SEA"
+    suggestion = suggest_location(text)
+    if suggestion:
+        message += f". Did you mean {suggestion[0]} ({suggestion[1]})?"
+    return message
@@ -0,0 +1,177 @@
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", 10000))
+# Fraction of successful, fast requests that get a completion log line
+LOG_SUCCESS_SAMPLE_RATE = float(os.environ.get("LOG_SUCCESS_SAMPLE_RATE", 0.1))
+LOG_SLOW_REQUEST_MS = float(os.environ.get("LOG_SLOW_REQUEST_MS", 2000))
+
+# Correlation state for the request being handled. asyncio.to_thread copies
+# the context, so upstream calls made from worker threads see it as well.
+request_id = contextvars.ContextVar("request_id", default=None)
+request_stages = contextvars.ContextVar("request_stages", default=None)
+
+_STANDARD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+logger = logging.getLogger("travel_planner.requests")
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, including the current request ID and any extra fields"""
+
+    def format(self, record):
+        entry = {
+            "time": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and key != "request_id":
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that drops records instead of blocking when the queue is full"""
+
+    dropped = 0
+
+    def prepare(self, record):
+        # Resolve everything that depends on the calling thread before queueing
+        record = copy.copy(record)
+        record.request_id = request_id.get()
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DroppingQueueHandler.dropped += 1
+
+
+_listener = None
+
+
+def configure_logging():
+    """Route all logging through a bounded queue drained by a background thread"""
+    global _listener
+    if _listener is not None:
+        return
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JSONFormatter())
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+
+    root = logging.getLogger()
+    root.handlers = [DroppingQueueHandler(log_queue)]
+    root.setLevel(LOG_LEVEL)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def new_request_id(incoming=None):
+    """The caller's request ID if it sent one, otherwise a fresh one"""
+    return (incoming or "")[:64] or uuid.uuid4().hex
+
+
+@contextmanager
+def request_context(incoming=None):
+    """Tag log lines with a request ID where RequestLoggingMiddleware does not, e.g. WebSocket messages"""
+    token = request_id.set(new_request_id(incoming))
+    try:
+        yield request_id.get()
+    finally:
+        request_id.reset(token)
+
+
+@contextmanager
+def stage(name):
+    """Time a stage of the current request; durations are reported with the request log"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages = request_stages.get()
+        if stages is not None:
+            elapsed = round((time.perf_counter() - started) * 1000, 1)
+            stages[name] = round(stages.get(name, 0) + elapsed, 1)
+
+
+class RequestLoggingMiddleware:
+    """Assign each request an ID and log its outcome with per-stage durations
+
+    The ID is taken from an incoming X-Request-ID header when present and is
+    echoed back in the response. Failed and slow requests are always logged;
+    other completions are sampled at LOG_SUCCESS_SAMPLE_RATE.
+    """
+
+    def __init__(self, app, sample_rate=LOG_SUCCESS_SAMPLE_RATE, slow_ms=LOG_SLOW_REQUEST_MS):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        rid = new_request_id(dict(scope["headers"]).get(b"x-request-id", b"").decode("latin-1"))
+        rid_token = request_id.set(rid)
+        stages = {}
+        stages_token = request_stages.set(stages)
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_request_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-request-id", rid.encode())
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            duration_ms = round((time.perf_counter() - started) * 1000, 1)
+            if status >= 500 or duration_ms >= self.slow_ms or random.random() < self.sample_rate:
+                logger.log(
+                    logging.WARNING if status >= 500 else logging.INFO,
+                    "request completed",
+                    extra={
+                        "method": scope["method"],
+                        "path": scope["path"],
+                        "status": status,
+                        "duration_ms": duration_ms,
+                        "stages": stages,
+                    },
+                )
+            request_stages.reset(stages_token)
+            request_id.reset(rid_token)
@@ -1,16 +1,98 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from pydantic import BaseModel
-from typing import List
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.websockets import WebSocketState
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response
+from pydantic import BaseModel, Field, PrivateAttr, ValidationError, field_validator, model_validator
+from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import date, timedelta
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+import asyncio
+import contextvars
+import json
+import logging
 import os
 import requests
+import time
 import uvicorn
 
+from answers import AnswerCache, plan_fingerprint
+from breakers import CircuitOpenError, breaker_from_env
+from cache import TTLCache
+from costs import estimate_costs, format_costs_markdown, format_costs_prompt
+from flights import FLIGHT_MAX_PAGE_SIZE, FLIGHT_PAGE_SIZE, FlightTable, minutes_of_day
+from live import LiveConnection, SlowConsumerError
+from locations import normalize_location, unknown_airport_message
+from logs import RequestLoggingMiddleware, configure_logging, request_context, stage
+from profiling import ProfileStore, ProfilerMiddleware, is_admin, profiled
+from quotas import USAGE_FLUSH_SECONDS, RateLimiter, UsageTracker, client_id, current_client
+from routing import ModelRouter
+from sessions import ChatSessionStore
+from warmer import CACHE_WARMER_ENABLED, CacheWarmer, RouteLog
+
+# Structured JSON logs, written from a background thread
+configure_logging()
+logger = logging.getLogger("travel_planner")
+
+async def flush_usage_periodically():
+    """Persist per-client usage to SQLite in the background"""
+    while True:
+        await asyncio.sleep(USAGE_FLUSH_SECONDS)
+        try:
+            await asyncio.to_thread(usage_tracker.flush)
+            await asyncio.to_thread(route_log.flush)
+        except Exception:
+            logger.exception("Error flushing usage")
+
+@asynccontextmanager
+async def lifespan(app):
+    """Start background tasks and flush usage on shutdown"""
+    tasks = [asyncio.create_task(flush_usage_periodically())]
+    if CACHE_WARMER_ENABLED:
+        tasks.append(asyncio.create_task(cache_warmer.run_forever()))
+    yield
+    for task in tasks:
+        task.cancel()
+    try:
+        usage_tracker.flush()
+        route_log.flush()
+    except Exception:
+        logger.exception("Error flushing usage")
+
 # Initialize FastAPI app
-app = FastAPI(title="Travel Planner AI")
+app = FastAPI(title="Travel Planner AI", lifespan=lifespan)
+
+async def enforce_quotas(request: Request, call_next):
+    """Attribute metered requests to a client and enforce its token or search quota"""
+    path = request.url.path
+    if path not in METERED_PATHS and path not in SEARCH_PATHS:
+        return await call_next(request)
+
+    client = client_id(request)
+    if path in SEARCH_PATHS:
+        retry_after, detail = search_limiter.check(client), "Flight search limit exceeded. Please slow down."
+    else:
+        retry_after, detail = usage_tracker.check(client), "Token quota exceeded. Please slow down."
+    if retry_after > 0:
+        return JSONResponse(
+            status_code=429,
+            content={"detail": detail},
+            headers={"Retry-After": str(int(retry_after) + 1)}
+        )
+
+    current_client.set(client)
+    started = time.perf_counter()
+    response = await call_next(request)
+    usage_tracker.record_request(client, time.perf_counter() - started)
+    return response
+
+# Middleware added first runs innermost: quota responses still get CORS
+# headers, profiling and request logging
+app.add_middleware(BaseHTTPMiddleware, dispatch=enforce_quotas)
 
 # Add CORS middleware
 app.add_middleware(
@@ -21,30 +103,199 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Opt-in per-request profiling, downloadable from /admin/profiles
+profile_store = ProfileStore()
+app.add_middleware(ProfilerMiddleware, store=profile_store)
+
+# Request IDs and per-stage timings. Added last, so it is outermost and also
+# covers responses produced by the quota, CORS and profiling middleware
+app.add_middleware(RequestLoggingMiddleware)
+
 # Configure Gemini API
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY")
 if GEMINI_API_KEY:
     genai.configure(api_key=GEMINI_API_KEY)
-    model = genai.GenerativeModel('gemini-1.5-flash')
+    model = ModelRouter()
 else:
     model = None
-    print("Warning: GEMINI_API_KEY not found in environment variables")
+    logger.warning("GEMINI_API_KEY not found in environment variables")
+
+# Upstream timeouts, in seconds
+GEMINI_TIMEOUT = float(os.environ.get("GEMINI_TIMEOUT_SECONDS", 60))
+SERP_API_TIMEOUT = float(os.environ.get("SERP_API_TIMEOUT_SECONDS", 10))
+
+# Circuit breakers so an upstream outage fails fast instead of tying up workers
+gemini_breaker = breaker_from_env("gemini", "GEMINI")
+serpapi_breaker = breaker_from_env("serpapi", "SERP_API")
+# Gemini errors that mean the service is unhealthy: timeouts, lost connections, 429 and 5xx
+GEMINI_OUTAGE_ERRORS = (
+    asyncio.TimeoutError,
+    ConnectionError,
+    requests.ConnectionError,
+    google_exceptions.ServerError,
+    google_exceptions.TooManyRequests,
+    google_exceptions.RetryError,
+)
+
+# Recent results, also served (even when stale) while an upstream is down
+plan_cache = TTLCache(
+    max_entries=int(os.environ.get("PLAN_CACHE_MAX_ENTRIES", 256)),
+    ttl_seconds=float(os.environ.get("PLAN_CACHE_TTL_SECONDS", 6 * 3600)),
+)
+flight_cache = TTLCache(
+    max_entries=int(os.environ.get("FLIGHT_CACHE_MAX_ENTRIES", 256)),
+    ttl_seconds=float(os.environ.get("FLIGHT_CACHE_TTL_SECONDS", 3600)),
+)
+
+# SerpAPI searches run on their own pool, so a burst of them queues there
+# instead of holding the default pool that every to_thread call shares
+serpapi_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("SERP_API_MAX_CONCURRENCY", 4)), thread_name_prefix="serpapi")
+# Searches in progress by flight cache key, shared by identical concurrent misses
+flight_searches = {}
+
+# Furthest the fare calendar looks either side of the requested date
+FARE_CALENDAR_MAX_DAYS = int(os.environ.get("FARE_CALENDAR_MAX_DAYS", 7))
+
+# Columnar views of cached flight searches for /flights, keyed like flight_cache
+flight_tables = TTLCache(max_entries=flight_cache.max_entries, ttl_seconds=flight_cache.ttl_seconds)
+
+# Per-client token accounting and quotas
+usage_tracker = UsageTracker()
+search_limiter = RateLimiter()
+
+# Endpoints that spend Gemini tokens and are subject to quotas
+METERED_PATHS = {"/generate-plan", "/chat", "/plan-trip"}
+# Endpoints whose cost is SerpAPI searches, limited per client by search_limiter
+SEARCH_PATHS = {"/flights", "/fare-calendar"}
+
+# Popular plan requests, refreshed ahead of expiry by the cache warmer
+route_log = RouteLog()
+
+# Conversations about a plan, so follow-ups don't resend it
+chat_sessions = ChatSessionStore(get_model=lambda name: model.get_model(name))
+
+# Answers to near-duplicate questions about the same plan
+answer_cache = AnswerCache()
+
+FLIGHTS_UNAVAILABLE = {"error": "Flight search is temporarily unavailable. Please try again shortly."}
+PLAN_UNAVAILABLE = "Travel planning is temporarily unavailable. Please try again shortly."
+
+# Request limits, checked before any upstream call
+MAX_TRIP_DAYS = int(os.environ.get("MAX_TRIP_DAYS", 30))
+MAX_TRAVELERS = int(os.environ.get("MAX_TRAVELERS", 20))
+MAX_INTERESTS = 20
 
 class TravelRequest(BaseModel):
-    source: str
-    destination: str
-    start_date: str
-    end_date: str
-    budget: float
-    travelers: int
+    source: str = Field(min_length=2, max_length=100)
+    destination: str = Field(min_length=2, max_length=100)
+    start_date: date
+    end_date: date
+    budget: float = Field(gt=0)
+    travelers: int = Field(ge=1, le=MAX_TRAVELERS)
     interests: List[str]
     include_flights: bool = False
 
+    _source_code: Optional[str] = PrivateAttr(default=None)
+    _destination_code: Optional[str] = PrivateAttr(default=None)
+
+    @field_validator("interests")
+    @classmethod
+    def normalize_interests(cls, interests):
+        """Lowercase, deduplicate and sort so equivalent requests compare equal"""
+        cleaned = sorted({" ".join(i.lower().split()) for i in interests} - {""})
+        if len(cleaned) > MAX_INTERESTS:
+            raise ValueError(f"At most {MAX_INTERESTS} interests are allowed")
+        return cleaned
+
+    @model_validator(mode="after")
+    def normalize_trip(self):
+        """Check the date range and map locations to canonical names and IATA codes"""
+        if self.start_date < date.today():
+            raise ValueError("start_date must not be in the past")
+        if self.end_date < self.start_date:
+            raise ValueError("end_date must be on or after start_date")
+        if (self.end_date - self.start_date).days + 1 > MAX_TRIP_DAYS:
+            raise ValueError(f"Trips are limited to {MAX_TRIP_DAYS} days")
+
+        source, destination = self.source, self.destination
+        self.source, self._source_code = normalize_location(source)
+        self.destination, self._destination_code = normalize_location(destination)
+        if self.include_flights:
+            for field, text, code in (("source", source, self._source_code),
+                                      ("destination", destination, self._destination_code)):
+                if not code:
+                    raise ValueError(unknown_airport_message(field, text))
+        return self
+
+    @property
+    def source_code(self):
+        return self._source_code
+
+    @property
+    def destination_code(self):
+        return self._destination_code
+
 class ChatRequest(BaseModel):
-    question: str
-    travel_plan: str
+    question: str = Field(min_length=1, max_length=2000)
+    travel_plan: str = ""
+    session_id: Optional[str] = None
+
+def plan_cache_key(request):
+    """Cache key for a travel plan request"""
+    return json.dumps(request.model_dump(mode="json"), sort_keys=True)
+
+async def generate_with_gemini(prompt, model_name):
+    """Generate content with the given model"""
+    return await call_gemini(model.get_model(model_name).generate_content, prompt, model_name)
+
+async def call_gemini(func, prompt, model_name, chunks=None):
+    """Call Gemini through its circuit breaker with a bounded wait
+
+    With ``chunks`` the response is streamed and the text of each chunk is
+    put on that queue as it arrives, followed by None.
+    """
+    gemini_breaker.before_call()
+    started = time.perf_counter()
+    # The SDK enforces the timeout too, so an abandoned call doesn't hold its worker thread
+    request_options = {"timeout": GEMINI_TIMEOUT}
+    if chunks is None:
+        call = asyncio.to_thread(profiled, func, prompt, request_options=request_options)
+    else:
+        call = asyncio.to_thread(
+            profiled, stream_into, func, prompt, chunks, asyncio.get_running_loop(), request_options)
+    try:
+        with stage("gemini"):
+            response = await asyncio.wait_for(call, timeout=GEMINI_TIMEOUT)
+    except asyncio.CancelledError:
+        # The caller went away; that says nothing about Gemini's health
+        gemini_breaker.release()
+        raise
+    except Exception as e:
+        # A blocked or invalid prompt is the caller's problem; only outages count against Gemini
+        if isinstance(e, GEMINI_OUTAGE_ERRORS):
+            gemini_breaker.record_failure()
+        else:
+            gemini_breaker.release()
+        model.record(model_name, time.perf_counter() - started, prompt, error=True)
+        logger.warning("Gemini call failed", extra={"model": model_name, "error": repr(e)})
+        raise
+    gemini_breaker.record_success()
+    prompt_tokens, response_tokens = model.record(model_name, time.perf_counter() - started, prompt, response)
+    usage_tracker.record_tokens(current_client.get(), prompt_tokens, response_tokens)
+    return response
+
+def stream_into(func, prompt, chunks, loop, request_options=None):
+    """Call ``func`` with stream=True, handing each chunk's text to the event loop"""
+    try:
+        response = func(prompt, stream=True, request_options=request_options)
+        for chunk in response:
+            loop.call_soon_threadsafe(chunks.put_nowait, chunk.text)
+        return response
+    finally:
+        loop.call_soon_threadsafe(chunks.put_nowait, None)
 
-def get_flight_data(source, destination, start_date):
+def get_flight_data(source, destination, start_date, refresh=False):
     """Fetch flight data from SerpAPI"""
     try:
         serp_api_key = os.environ.get("SERP_API_KEY")
@@ -54,6 +305,18 @@ def get_flight_data(source, destination, start_date):
         source_code = source.strip().upper()
         dest_code = destination.strip().upper()
 
+        cache_key = (source_code, dest_code, start_date)
+        cached = None if refresh else flight_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        try:
+            serpapi_breaker.before_call()
+        except CircuitOpenError:
+            return flight_cache.get(cache_key, allow_stale=True) or FLIGHTS_UNAVAILABLE
+
+        # Only searches that reach SerpAPI count against the client's limit
+        search_limiter.consume(current_client.get())
         url = "https://serpapi.com/search.json"
         params = {
             "engine": "google_flights",
@@ -66,14 +329,73 @@ def get_flight_data(source, destination, start_date):
             "api_key": serp_api_key
         }
 
-        response = requests.get(url, params=params, timeout=10)
+        try:
+            with stage("serpapi"):
+                response = requests.get(url, params=params, timeout=SERP_API_TIMEOUT)
+        except requests.RequestException as e:
+            serpapi_breaker.record_failure()
+            logger.warning("SerpAPI request failed", extra={"error": repr(e)})
+            return flight_cache.get(cache_key, allow_stale=True)
+
+        # Rate limiting and server errors mean SerpAPI itself is struggling
+        if response.status_code == 429 or response.status_code >= 500:
+            serpapi_breaker.record_failure()
+            logger.warning("SerpAPI error response", extra={"status": response.status_code})
+            return flight_cache.get(cache_key, allow_stale=True)
+
+        serpapi_breaker.record_success()
         if response.status_code == 200:
-            return response.json()
+            flight_data = response.json()
+            flight_cache.set(cache_key, flight_data)
+            return flight_data
         return None
-    except Exception as e:
-        print(f"Error fetching flight data: {str(e)}")
+    except Exception:
+        logger.exception("Error fetching flight data")
         return None
 
+async def fetch_flight_data(source, destination, start_date, refresh=False):
+    """get_flight_data for async callers, making at most one SerpAPI call per route and date at a time
+
+    Cache hits return without leaving the event loop.
+    """
+    cache_key = (source.strip().upper(), destination.strip().upper(), start_date)
+    if not refresh:
+        cached = flight_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    search = flight_searches.get(cache_key)
+    if search is None:
+        context = contextvars.copy_context()
+        search = asyncio.get_running_loop().run_in_executor(
+            serpapi_executor, context.run, profiled, get_flight_data, source, destination, start_date, refresh)
+        flight_searches[cache_key] = search
+        search.add_done_callback(lambda _: flight_searches.pop(cache_key, None))
+    # A caller that goes away must not cancel the search others are waiting on
+    return await asyncio.shield(search)
+
+async def warm_plan(payload):
+    """Regenerate one logged plan request, skipping ones that are no longer valid"""
+    try:
+        request = TravelRequest.model_validate_json(payload)
+    except ValueError:
+        return False
+    current_client.set("system:warmer")
+    # build_travel_plan falls back to the stale plan while Gemini is down; that must end the run
+    if not gemini_breaker.allow_request():
+        raise CircuitOpenError("gemini", gemini_breaker.snapshot()["retry_after_seconds"])
+    result = await build_travel_plan(request, "plan", refresh=True)
+    if result.get("stale"):
+        raise CircuitOpenError("gemini", gemini_breaker.snapshot()["retry_after_seconds"])
+    return True
+
+cache_warmer = CacheWarmer(
+    route_log,
+    warm=warm_plan,
+    age=plan_cache.age,
+    ttl_seconds=plan_cache.ttl_seconds,
+)
+
 @app.get("/")
 async def root():
     """Serve the main page or API info"""
@@ -84,9 +406,18 @@ async def root():
             "message": "Travel Planning AI API is running",
             "status": "healthy",
             "gemini_configured": bool(model),
-            "endpoints": ["/health", "/generate-plan", "/chat", "/plan-trip"]
+            "endpoints": ["/health", "/generate-plan", "/chat", "/plan-trip", "/flights", "/fare-calendar", "/ws"]
         }
 
+@app.get("/sw.js")
+async def service_worker():
+    """Serve the service worker from the root so it controls the whole site"""
+    return FileResponse(
+        'static/sw.js',
+        media_type="application/javascript",
+        headers={"Cache-Control": "no-cache"}
+    )
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
@@ -97,122 +428,600 @@ async def health_check():
             "GEMINI_API_KEY": bool(os.environ.get("GEMINI_API_KEY")),
             "GOOGLE_API_KEY": bool(os.environ.get("GOOGLE_API_KEY")),
             "SERP_API_KEY": bool(os.environ.get("SERP_API_KEY"))
+        },
+        "circuit_breakers": {
+            "gemini": gemini_breaker.snapshot(),
+            "serpapi": serpapi_breaker.snapshot()
+        },
+        "caches": {
+            "plans": plan_cache.stats(),
+            "flights": flight_cache.stats()
+        },
+        "models": model.stats() if model else {},
+        "chat_sessions": chat_sessions.stats(),
+        "answer_cache": answer_cache.stats(),
+        "cache_warmer": {
+            "enabled": CACHE_WARMER_ENABLED,
+            "last_run": cache_warmer.last_run
         }
     }
 
+@app.get("/usage")
+async def get_usage(request: Request):
+    """Token usage and remaining quota for the calling client"""
+    client = client_id(request)
+    return {"client": client, "usage": usage_tracker.usage(client)}
+
+def require_admin(request):
+    """Reject requests without a valid X-Admin-Token header"""
+    if not is_admin(request.headers.get("x-admin-token")):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+@app.get("/admin/profiles")
+async def list_profiles(request: Request):
+    """Recently captured request profiles"""
+    require_admin(request)
+    return {"profiles": profile_store.list()}
+
+@app.get("/admin/profiles/{profile_id}")
+async def download_profile(profile_id: str, request: Request, format: str = "prof"):
+    """Download a profile as a pstats file, or as a text report with ?format=text"""
+    require_admin(request)
+    profile = profile_store.get(profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "text":
+        return PlainTextResponse(profile_store.summary(profile_id))
+    return Response(
+        content=profile["stats"],
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": f'attachment; filename="{profile_id}.prof"'}
+    )
+
 @app.post("/generate-plan")
 async def generate_travel_plan(request: TravelRequest):
     """Generate a comprehensive travel plan"""
+    route_log.record(plan_cache_key(request))
+    return await build_travel_plan(request, "plan")
+
+async def build_travel_plan(request, endpoint, refresh=False):
+    """Generate a travel plan using the model routed for ``endpoint``
+
+    With ``refresh`` set, fresh cache entries are regenerated instead of served.
+    """
     try:
         if not model:
             raise HTTPException(
                 status_code=500, 
                 detail="Gemini AI is not configured. Please set GEMINI_API_KEY environment variable."
             )
-        
-        # Construct the prompt
-        prompt = f"""
-Create a detailed travel plan with the following details:
-From: {request.source}
-To: {request.destination}
-Dates: {request.start_date} to {request.end_date}
-Budget: ₹{request.budget} (Indian Rupees)
-Number of Travelers: {request.travelers}
-Interests: {', '.join(request.interests)}
 
-Please provide:
-1. Day-by-day itinerary
-2. Estimated costs breakdown (in Indian Rupees - INR)
-3. Recommended accommodations
-4. Must-visit places based on the interests
-5. Local transportation options
-6. Food recommendations
-7. Tips and precautions
-8. Weather considerations for the dates
-
-Note: All cost estimates should be provided in Indian Rupees (INR) with ₹ symbol.
-Format the response in markdown for better readability.
-"""
+        cache_key = plan_cache_key(request)
+        cached_plan = None if refresh else plan_cache.get(cache_key)
+        if cached_plan is not None:
+            if missing_flights(request, cached_plan):
+                return {**cached_plan, "flight_details": await plan_flights(request) or None}
+            return cached_plan
+
+        # Serve a stale plan straight away while Gemini is known to be down
+        if not gemini_breaker.allow_request():
+            return stale_plan_or_unavailable(cache_key)
+        
+        # Compute the cost breakdown server-side instead of asking the model
+        with stage("costs"):
+            costs = estimate_costs(
+                request.destination, request.start_date, request.end_date,
+                request.travelers, request.budget, request.destination_code)
 
         # Generate response using Gemini
-        response = model.generate_content(prompt)
+        try:
+            model_name = model.pick(endpoint, trip_days=costs["days"])
+            response = await generate_with_gemini(plan_prompt(request, costs), model_name)
+        except (CircuitOpenError, asyncio.TimeoutError):
+            return stale_plan_or_unavailable(cache_key)
         
         if not response or not response.text:
             raise HTTPException(status_code=500, detail="Failed to generate travel plan")
 
         # Handle flight data if requested
-        flight_data = None
-        if request.include_flights:
-            try:
-                flight_data = get_flight_data(request.source, request.destination, request.start_date)
-            except Exception as e:
-                print(f"Flight data error: {str(e)}")
-
-        # Format the travel plan
-        travel_plan = f"""# Your Travel Plan
-
-{response.text}
-"""
+        flight_data = await plan_flights(request, refresh=refresh)
 
-        return {
+        result = {
             "success": True,
-            "plan": travel_plan,
-            "flight_details": flight_data if flight_data else None
+            "plan": format_travel_plan(response.text, costs),
+            "cost_breakdown": costs,
+            "flight_details": flight_data if flight_data else None,
+            "flight_query": flight_query(request)
         }
+        plan_cache.set(cache_key, cacheable_plan(result))
+        return result
         
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error in generate_travel_plan: {str(e)}")
+        logger.exception("Error in generate_travel_plan")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+async def plan_flights(request, refresh=False):
+    """Flight search results for a plan, or None when not requested or the search failed"""
+    if not request.include_flights:
+        return None
+    try:
+        return await fetch_flight_data(
+            request.source_code, request.destination_code,
+            request.start_date.isoformat(), refresh=refresh)
+    except Exception:
+        logger.exception("Flight data error")
+        return None
+
+def cacheable_plan(result):
+    """The plan result to cache: missing flights are searched again on the next hit"""
+    if result["flight_details"] is FLIGHTS_UNAVAILABLE:
+        return {**result, "flight_details": None}
+    return result
+
+def missing_flights(request, plan):
+    """Whether a cached plan lacks the flights its request asked for"""
+    return request.include_flights and not plan.get("flight_details")
+
+def flight_query(request):
+    """Parameters for /flights that page through this plan's flight options"""
+    if not request.include_flights:
+        return None
+    return {
+        "source": request.source_code,
+        "destination": request.destination_code,
+        "date": request.start_date.isoformat()
+    }
+
+def stale_plan_or_unavailable(cache_key):
+    """Expired cached plan for ``cache_key``, or a 503 when there is none"""
+    stale_plan = plan_cache.get(cache_key, allow_stale=True)
+    if stale_plan is not None:
+        return {**stale_plan, "stale": True}
+    raise HTTPException(status_code=503, detail=PLAN_UNAVAILABLE)
+
+def plan_prompt(request, costs):
+    """Prompt asking Gemini for the itinerary, with the precomputed costs as facts"""
+    return f"""
+Create a detailed travel plan with the following details:
+From: {request.source}
+To: {request.destination}
+Dates: {request.start_date} to {request.end_date}
+Budget: ₹{request.budget} (Indian Rupees)
+Number of Travelers: {request.travelers}
+Interests: {', '.join(request.interests)}
+
+The cost breakdown has already been calculated. Treat these figures as fixed facts:
+{format_costs_prompt(costs)}
+
+Please provide:
+1. Day-by-day itinerary
+2. Recommended accommodations matching the comfort level above
+3. Must-visit places based on the interests
+4. Local transportation options
+5. Food recommendations
+6. Tips and precautions
+7. Weather considerations for the dates
+
+Do not include a cost breakdown section; it is added separately.
+Note: Any prices you mention should be in Indian Rupees (INR) with ₹ symbol.
+Format the response in markdown for better readability.
+"""
+
+def format_travel_plan(text, costs):
+    """Final plan markdown: the model's itinerary followed by the cost breakdown"""
+    return f"""# Your Travel Plan
+
+{text}
+
+{format_costs_markdown(costs)}"""
+
 @app.post("/chat")
 async def chat_with_plan(request: ChatRequest):
-    """Chat about the travel plan"""
+    """Chat about the travel plan
+
+    The first question starts a session from ``travel_plan``; follow-ups
+    that pass the returned ``session_id`` only send the new question.
+    """
     try:
         if not model:
             raise HTTPException(
                 status_code=500, 
                 detail="Gemini AI is not configured. Please set GEMINI_API_KEY environment variable."
             )
-            
-        prompt = f"""
-Given this travel plan:
-{request.travel_plan}
 
-Please answer this question about the plan:
-{request.question}
+        session = chat_sessions.get(request.session_id)
+        if session is None and not request.travel_plan:
+            raise HTTPException(
+                status_code=404,
+                detail="Chat session expired. Please send the travel plan again."
+            )
 
-Provide a clear and concise response, using markdown formatting where appropriate.
-If the question is about something not covered in the plan, suggest relevant information or alternatives.
-"""
+        # Someone already asked (nearly) this question about this plan
+        fingerprint = session.plan_fingerprint if session else plan_fingerprint(request.travel_plan)
+        cached_answer = answer_cache.lookup(fingerprint, request.question)
+        if cached_answer is not None:
+            return {
+                "success": True,
+                "response": cached_answer,
+                "session_id": session.session_id if session else None,
+                "cached": True
+            }
+
+        if session is None:
+            with stage("chat_session"):
+                session = await asyncio.to_thread(
+                    chat_sessions.create, request.travel_plan, model.pick("chat", question=request.question))
 
-        response = model.generate_content(prompt)
+        try:
+            # Turns of one session must not interleave in its history
+            async with session.lock:
+                first_turn = session.turns == 0
+                response = await call_gemini(session.chat.send_message, request.question, session.model_name)
+                session.finish_turn()
+        except (CircuitOpenError, asyncio.TimeoutError):
+            raise HTTPException(
+                status_code=503,
+                detail="Chat is temporarily unavailable. Please try again shortly."
+            )
         
         if not response or not response.text:
             raise HTTPException(status_code=500, detail="Failed to generate response")
+
+        # Later answers may depend on the conversation, so only share first ones
+        if first_turn:
+            answer_cache.store(fingerprint, request.question, response.text)
             
         return {
             "success": True,
-            "response": response.text
+            "response": response.text,
+            "session_id": session.session_id
         }
         
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error in chat_with_plan: {str(e)}")
+        logger.exception("Error in chat_with_plan")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+TIME_OF_DAY = r"^([01]\d|2[0-3]):[0-5]\d$"
+
+@app.get("/flights")
+async def query_flights(
+    source: str = Query(min_length=2, max_length=100),
+    destination: str = Query(min_length=2, max_length=100),
+    outbound_date: date = Query(alias="date"),
+    sort: str = Query("price", pattern="^(price|duration|stops|departure)$"),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    max_price: Optional[float] = Query(None, gt=0),
+    max_stops: Optional[int] = Query(None, ge=0),
+    max_duration: Optional[int] = Query(None, gt=0, description="Minutes"),
+    airline: Optional[List[str]] = Query(None),
+    depart_after: Optional[str] = Query(None, pattern=TIME_OF_DAY),
+    depart_before: Optional[str] = Query(None, pattern=TIME_OF_DAY),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(FLIGHT_PAGE_SIZE, ge=1, le=FLIGHT_MAX_PAGE_SIZE),
+):
+    """Sort, filter and page through the flight options for a route and date
+
+    Queries run over the cached search results, so SerpAPI is only called
+    when the route and date have not been searched recently.
+    """
+    if outbound_date < date.today():
+        raise HTTPException(status_code=422, detail="date must not be in the past")
+    source_code, destination_code = route_codes(source, destination)
+    table = await flight_table(source_code, destination_code, outbound_date.isoformat())
+    if table is None:
+        raise HTTPException(status_code=503, detail=FLIGHTS_UNAVAILABLE["error"])
+
+    return {
+        "source": source_code,
+        "destination": destination_code,
+        "date": outbound_date.isoformat(),
+        **table.query(
+            sort=sort,
+            descending=order == "desc",
+            max_price=max_price,
+            max_stops=max_stops,
+            max_duration=max_duration,
+            airlines=airline,
+            depart_after=minutes_of_day(depart_after) if depart_after else None,
+            depart_before=minutes_of_day(depart_before) if depart_before else None,
+            offset=offset,
+            limit=limit,
+        )
+    }
+
+async def flight_table(source_code, destination_code, outbound_date):
+    """Columnar table for a flight search, rebuilt only when the cached search changes"""
+    flight_data = await fetch_flight_data(source_code, destination_code, outbound_date)
+    if not flight_data or flight_data is FLIGHTS_UNAVAILABLE:
+        return None
+
+    cache_key = (source_code, destination_code, outbound_date)
+    cached = flight_tables.get(cache_key)
+    if cached is not None and cached[0] is flight_data:
+        return cached[1]
+    table = FlightTable.from_serpapi(flight_data)
+    flight_tables.set(cache_key, (flight_data, table))
+    return table
+
+@app.get("/fare-calendar")
+async def fare_calendar(
+    source: str = Query(min_length=2, max_length=100),
+    destination: str = Query(min_length=2, max_length=100),
+    outbound_date: date = Query(alias="date"),
+    days: int = Query(3, ge=0, le=FARE_CALENDAR_MAX_DAYS),
+):
+    """Cheapest and median fares for each day within ``days`` of ``date``
+
+    All days are searched concurrently. Days already in the flight cache
+    cost nothing, and SerpAPI calls are capped by SERP_API_MAX_CONCURRENCY.
+    Past dates are skipped.
+    """
+    source_code, destination_code = route_codes(source, destination)
+    dates = [outbound_date + timedelta(days=offset) for offset in range(-days, days + 1)]
+    dates = [day for day in dates if day >= date.today()]
+
+    async def search(day):
+        table = await flight_table(source_code, destination_code, day.isoformat())
+        if table is None:
+            return {"date": day.isoformat(), "available": False}
+        return {"date": day.isoformat(), "available": True, **table.price_summary()}
+
+    grid = await asyncio.gather(*(search(day) for day in dates))
+    priced = [day for day in grid if day.get("min_price") is not None]
+    return {
+        "source": source_code,
+        "destination": destination_code,
+        "date": outbound_date.isoformat(),
+        "days": grid,
+        "cheapest_date": min(priced, key=lambda day: day["min_price"])["date"] if priced else None
+    }
+
+def route_codes(source, destination):
+    """IATA codes for a route, or a 422 naming the location that is not an airport"""
+    codes = []
+    for field, text in (("source", source), ("destination", destination)):
+        _, code = normalize_location(text)
+        if not code:
+            raise HTTPException(status_code=422, detail=unknown_airport_message(field, text))
+        codes.append(code)
+    return codes
+
 @app.post("/plan-trip")
 async def plan_trip(request: TravelRequest):
     """Legacy endpoint for backward compatibility"""
-    return await generate_travel_plan(request)
+    route_log.record(plan_cache_key(request))
+    return await build_travel_plan(request, "legacy")
+
+@app.websocket("/ws")
+async def live_session(websocket: WebSocket):
+    """Plan generation and chat over one long-lived connection
+
+    Client messages:
+      {"type": "plan", "request": {...}}  same fields as /generate-plan
+      {"type": "chat", "question": "..."} about the plan from this connection;
+                                          add "travel_plan" to chat about another one
+      {"type": "pong"}                    reply to the server's heartbeat
+
+    Plan and chat messages may carry a "request_id", used in log lines and
+    echoed in ``error`` replies; otherwise one is generated per message.
+
+    Server messages: ``plan_chunk`` and ``chat_chunk`` carry text as it is
+    generated, ``plan`` and ``answer`` the finished result, ``flights`` the
+    flight results whenever they arrive (possibly after the plan), ``error``
+    a status and detail for a failed request, and ``ping`` the heartbeat.
+    Requests are handled one at a time in the order they were sent.
+    """
+    await websocket.accept()
+    conn = LiveConnection(websocket)
+    client = client_id(websocket)
+    current_client.set(client)
+    state = {"travel_plan": "", "session_id": None, "background": set()}
+    tasks = [asyncio.create_task(job) for job in (conn.run_reader(), conn.run_writer(), conn.run_heartbeat())]
+    try:
+        while (message := await conn.inbox.get()) is not None:
+            retry_after = usage_tracker.check(client)
+            if retry_after > 0:
+                await conn.send({
+                    "type": "error",
+                    "status": 429,
+                    "detail": "Token quota exceeded. Please slow down.",
+                    "retry_after": int(retry_after) + 1
+                })
+                continue
+
+            started = time.perf_counter()
+            # Each message gets its own request ID, inherited by its Gemini and SerpAPI calls
+            incoming = message.get("request_id")
+            with request_context(incoming if isinstance(incoming, str) else None) as rid:
+                try:
+                    await handle_live_message(conn, state, message)
+                except HTTPException as e:
+                    await conn.send({"type": "error", "status": e.status_code, "detail": e.detail, "request_id": rid})
+                except (WebSocketDisconnect, SlowConsumerError):
+                    raise
+                except Exception as e:
+                    logger.exception("Error in live_session")
+                    await conn.send({
+                        "type": "error",
+                        "status": 500,
+                        "detail": f"Internal server error: {str(e)}",
+                        "request_id": rid
+                    })
+            usage_tracker.record_request(client, time.perf_counter() - started)
+    except (WebSocketDisconnect, SlowConsumerError):
+        pass
+    finally:
+        for task in tasks:
+            task.cancel()
+        if websocket.client_state == WebSocketState.CONNECTED:
+            await websocket.close()
+
+async def handle_live_message(conn, state, message):
+    """Dispatch one client request received on a live connection"""
+    if not model:
+        raise HTTPException(
+            status_code=500,
+            detail="Gemini AI is not configured. Please set GEMINI_API_KEY environment variable."
+        )
+    try:
+        if message.get("type") == "plan":
+            await live_plan(conn, state, TravelRequest.model_validate(message.get("request") or {}))
+        elif message.get("type") == "chat":
+            await live_chat(conn, state, ChatRequest.model_validate(message))
+        else:
+            raise HTTPException(status_code=400, detail="Unknown message type")
+    except ValidationError as e:
+        # Same shape as FastAPI's validation errors on the HTTP endpoints
+        raise HTTPException(
+            status_code=422,
+            detail=[{"loc": err["loc"], "msg": err["msg"]} for err in e.errors()]
+        )
+
+async def stream_to_client(conn, message_type, func, prompt, model_name):
+    """Call Gemini and forward its output to the client as it is generated
+
+    The client is fed from a separate task, so a slow reader never counts
+    against Gemini's timeout or circuit breaker.
+    """
+    chunks = asyncio.Queue()
+    sender = asyncio.create_task(conn.send_stream(message_type, chunks))
+    try:
+        response = await call_gemini(func, prompt, model_name, chunks=chunks)
+    except BaseException:
+        sender.cancel()
+        raise
+    await sender
+    return response
+
+async def live_plan(conn, state, request):
+    """Stream a plan to the client, then push its flights as soon as they arrive"""
+    cache_key = plan_cache_key(request)
+    route_log.record(cache_key)
+
+    flights = None
+    result = plan_cache.get(cache_key)
+    if result is None:
+        # Search flights while the plan is being generated
+        if request.include_flights:
+            flights = asyncio.create_task(plan_flights(request))
+        result = await stream_travel_plan(conn, request, cache_key)
+        if flights is None and not result.get("stale"):
+            plan_cache.set(cache_key, result)
+    elif missing_flights(request, result):
+        # The cached plan's flight search failed; try again without re-caching the plan
+        flights = asyncio.create_task(plan_flights(request))
+        cache_key = None
+
+    state["travel_plan"] = result["plan"]
+    state["session_id"] = None
+    await conn.send({"type": "plan", **result})
+
+    if flights is not None:
+        # Keep a reference so the task is not garbage collected mid-flight
+        task = asyncio.create_task(deliver_flights(conn, flights, result, cache_key))
+        state["background"].add(task)
+        task.add_done_callback(state["background"].discard)
+
+async def stream_travel_plan(conn, request, cache_key):
+    """Generate a plan, streaming the itinerary text to the client"""
+    if not gemini_breaker.allow_request():
+        return stale_plan_or_unavailable(cache_key)
+
+    with stage("costs"):
+        costs = estimate_costs(
+            request.destination, request.start_date, request.end_date,
+            request.travelers, request.budget, request.destination_code)
+
+    try:
+        model_name = model.pick("plan", trip_days=costs["days"])
+        response = await stream_to_client(
+            conn, "plan_chunk", model.get_model(model_name).generate_content,
+            plan_prompt(request, costs), model_name)
+    except (CircuitOpenError, asyncio.TimeoutError):
+        return stale_plan_or_unavailable(cache_key)
+
+    if not response or not response.text:
+        raise HTTPException(status_code=500, detail="Failed to generate travel plan")
+
+    return {
+        "success": True,
+        "plan": format_travel_plan(response.text, costs),
+        "cost_breakdown": costs,
+        "flight_details": None,
+        "flight_query": flight_query(request)
+    }
+
+async def deliver_flights(conn, flights, result, cache_key):
+    """Push late flight results to the client and cache the completed plan unless ``cache_key`` is None"""
+    flight_data = await flights
+    if cache_key is not None and not result.get("stale"):
+        plan_cache.set(cache_key, cacheable_plan({**result, "flight_details": flight_data or None}))
+    try:
+        await conn.send({"type": "flights", "flight_details": flight_data or None})
+    except (WebSocketDisconnect, SlowConsumerError):
+        pass
+
+async def live_chat(conn, state, request):
+    """Answer a question about the connection's plan, streaming the answer"""
+    if request.travel_plan and request.travel_plan != state["travel_plan"]:
+        state["travel_plan"] = request.travel_plan
+        state["session_id"] = None
+    if not state["travel_plan"]:
+        raise HTTPException(
+            status_code=404,
+            detail="No travel plan yet. Generate a plan or send one with the question."
+        )
+
+    session = chat_sessions.get(state["session_id"])
+    fingerprint = session.plan_fingerprint if session else plan_fingerprint(state["travel_plan"])
+    cached_answer = answer_cache.lookup(fingerprint, request.question)
+    if cached_answer is not None:
+        await conn.send({"type": "answer", "response": cached_answer, "cached": True})
+        return
+
+    if session is None:
+        with stage("chat_session"):
+            session = await asyncio.to_thread(
+                chat_sessions.create, state["travel_plan"], model.pick("chat", question=request.question))
+        state["session_id"] = session.session_id
+
+    try:
+        async with session.lock:
+            first_turn = session.turns == 0
+            try:
+                response = await stream_to_client(
+                    conn, "chat_chunk", session.chat.send_message, request.question, session.model_name)
+            except (asyncio.CancelledError, asyncio.TimeoutError):
+                # The stream may still be running in its thread; the next question starts a new session
+                state["session_id"] = None
+                raise
+            except Exception:
+                if not session.discard_failed_turn():
+                    state["session_id"] = None
+                raise
+            session.finish_turn()
+    except (CircuitOpenError, asyncio.TimeoutError):
+        raise HTTPException(
+            status_code=503,
+            detail="Chat is temporarily unavailable. Please try again shortly."
+        )
+
+    if not response or not response.text:
+        raise HTTPException(status_code=500, detail="Failed to generate response")
+
+    if first_turn:
+        answer_cache.store(fingerprint, request.question, response.text)
+    await conn.send({"type": "answer", "response": response.text})
 
 # Mount static files
 try:
     app.mount("/static", StaticFiles(directory="static"), name="static")
 except Exception as e:
-    print(f"Could not mount static files: {e}")
+    logger.warning(f"Could not mount static files: {e}")
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8000))
@@ -0,0 +1,154 @@
+import cProfile
+import contextvars
+import hmac
+import io
+import marshal
+import os
+import pstats
+import random
+import secrets
+import time
+from collections import OrderedDict
+
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+PROFILE_MAX_STORED = int(os.environ.get("PROFILE_MAX_STORED", 20))
+
+# Profilers for worker-thread work done on behalf of the request being profiled
+_thread_profilers = contextvars.ContextVar("thread_profilers", default=None)
+
+
+def is_admin(token):
+    """Whether ``token`` (text or raw header bytes) matches ADMIN_TOKEN; always False when none is configured"""
+    if not ADMIN_TOKEN or not token:
+        return False
+    if isinstance(token, str):
+        token = token.encode()
+    # Compared as bytes: compare_digest rejects non-ASCII text
+    return hmac.compare_digest(token, ADMIN_TOKEN.encode())
+
+
+def profiled(func, *args, **kwargs):
+    """Call ``func``, profiling it when it runs in a worker thread for a profiled request
+
+    asyncio.to_thread copies the request's context, so wrapping the callable
+    passed to it is enough.
+    """
+    profilers = _thread_profilers.get()
+    if profilers is None:
+        return func(*args, **kwargs)
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler already owns this thread
+        return func(*args, **kwargs)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        profiler.disable()
+        profilers.append(profiler)
+
+
+class _StoredProfile:
+    """Stand-in profiler that lets pstats.Stats load already collected stats"""
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+class ProfileStore:
+    """The most recent request profiles, in pstats format"""
+
+    def __init__(self, max_profiles=PROFILE_MAX_STORED):
+        self.max_profiles = max_profiles
+        self._profiles = OrderedDict()
+
+    def add(self, profile_id, path, duration, profiler, thread_profilers=()):
+        stats = pstats.Stats(profiler)
+        for thread_profiler in thread_profilers:
+            stats.add(thread_profiler)
+        self._profiles[profile_id] = {
+            "id": profile_id,
+            "path": path,
+            "duration_ms": round(duration * 1000, 1),
+            "captured_at": time.time(),
+            "stats": marshal.dumps(stats.stats),
+        }
+        while len(self._profiles) > self.max_profiles:
+            self._profiles.popitem(last=False)
+
+    def list(self):
+        return [
+            {key: value for key, value in profile.items() if key != "stats"}
+            for profile in reversed(self._profiles.values())
+        ]
+
+    def get(self, profile_id):
+        return self._profiles.get(profile_id)
+
+    def summary(self, profile_id, limit=30):
+        """Text report of the functions with the most cumulative time"""
+        profile = self._profiles[profile_id]
+        output = io.StringIO()
+        pstats.Stats(_StoredProfile(marshal.loads(profile["stats"])), stream=output).sort_stats("cumulative").print_stats(limit)
+        return output.getvalue()
+
+
+class ProfilerMiddleware:
+    """Capture a cProfile of selected requests
+
+    A request is profiled when it carries ``X-Profile: 1`` together with a
+    valid ``X-Admin-Token``, or when it is picked by PROFILE_SAMPLE_RATE.
+    Only one request is profiled at a time; anything else passes straight
+    through, so the cost when profiling is off is a header lookup.
+
+    The profile covers code running on the event loop thread while the
+    request is in flight, which includes other requests interleaving with
+    it, plus worker-thread calls wrapped in ``profiled`` for this request
+    (the Gemini and SerpAPI calls, including JSON decoding).
+    """
+
+    def __init__(self, app, store, sample_rate=PROFILE_SAMPLE_RATE):
+        self.app = app
+        self.store = store
+        self.sample_rate = sample_rate
+        self._active = False
+
+    def _wants_profile(self, scope):
+        headers = dict(scope["headers"])
+        if headers.get(b"x-profile") == b"1":
+            return is_admin(headers.get(b"x-admin-token"))
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self._active or not self._wants_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = secrets.token_hex(6)
+
+        async def send_with_profile_id(message):
+            # Tell the caller where to download its profile
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-profile-id", profile_id.encode())
+                ]
+            await send(message)
+
+        self._active = True
+        thread_profilers = []
+        token = _thread_profilers.set(thread_profilers)
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            profiler.disable()
+            _thread_profilers.reset(token)
+            self._active = False
+            self.store.add(profile_id, scope["path"], time.perf_counter() - started, profiler, list(thread_profilers))
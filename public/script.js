@@ -1,118 +1,234 @@
-// Initialize travel plan variable
-let currentTravelPlan = "";
-
-document.getElementById('travelForm').addEventListener('submit', async (e) => {
-    e.preventDefault();
-
-    // Show loading spinner
-    document.getElementById('loadingSpinner').classList.remove('hidden');
-    document.getElementById('result').classList.add('hidden');
-
-    // Get form values
-    const source = document.getElementById('source').value;
-    const destination = document.getElementById('destination').value;
-    const startDate = document.getElementById('startDate').value;
-    const endDate = document.getElementById('endDate').value;
-    const budget = parseFloat(document.getElementById('budget').value);
-    const travelers = parseInt(document.getElementById('travelers').value);
-    const interests = document.getElementById('interests').value.split(',').map(interest => interest.trim());
-    const includeFlights = document.getElementById('includeFlights').checked;
-
-    try {
-        const response = await fetch('/api/generate-plan', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({
-                source,
-                destination,
-                start_date: startDate,
-                end_date: endDate,
-                budget,
-                travelers,
-                interests,
-                include_flights: includeFlights
-            }),
-        });
-
-        const data = await response.json();
-
-        if (response.ok) {
-            // Display the result
-            document.getElementById('planContent').innerHTML = marked.parse(data.plan);
-            document.getElementById('chatMessages').innerHTML = ''; // Clear previous chat messages
-            currentTravelPlan = data.plan;  // Store the travel plan
-            // Show chat box
-            document.getElementById('chatBox').classList.remove('hidden');
-            
-            // Handle flight details
-            const flightDetailsDiv = document.getElementById('flightDetails');
-            if (data.flight_details) {
-                document.getElementById('flightContent').innerHTML = marked.parse(data.flight_details);
-                flightDetailsDiv.classList.remove('hidden');
-            } else {
-                flightDetailsDiv.classList.add('hidden');
-            }
-            document.getElementById('result').classList.remove('hidden');
-        } else {
-            alert('Error: ' + data.detail);
-        }
-    } catch (error) {
-        alert('Error connecting to the server: ' + error.message);
-    } finally {
-        // Hide loading spinner
-        document.getElementById('loadingSpinner').classList.add('hidden');
-    }
-});
-
-async function sendMessage() {
-    const chatInput = document.getElementById('chatInput');
-    const message = chatInput.value.trim();
-    if (!message) return;
-
-    // Clear input
-    chatInput.value = '';
-
-    // Add user message to chat
-    addMessageToChat(message, true);
-
-    try {
-        const response = await fetch('/api/chat', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({
-                question: message,
-                travel_plan: currentTravelPlan
-            }),
-        });
-
-        const data = await response.json();
-        if (response.ok) {
-            // Add AI response to chat
-            addMessageToChat(data.response, false);
-        } else {
-            addMessageToChat("Sorry, I couldn't process your question. Please try again.", false);
-        }
-    } catch (error) {
-        addMessageToChat("Error connecting to the server. Please try again.", false);
-    }
-}
-
-function addMessageToChat(message, isUser) {
-    const chatMessages = document.getElementById('chatMessages');
-    const messageDiv = document.createElement('div');
-    messageDiv.className = `message ${isUser ? 'user-message' : 'ai-message'} ${isUser ? 'user' : 'ai'}`;
-    messageDiv.innerHTML = marked.parse(message);
-    chatMessages.appendChild(messageDiv);
-    chatMessages.scrollTop = chatMessages.scrollHeight;
-}
-
-// Handle Enter key in chat input
-document.getElementById('chatInput').addEventListener('keypress', (e) => {
-    if (e.key === 'Enter') {
-        sendMessage();
-    }
-});
+// Initialize travel plan variable
+let currentTravelPlan = "";
+let currentChatSession = null;  // server-side chat session about the current plan
+
+// Browser-side plan cache (IndexedDB), keyed on the normalized form inputs
+const PLAN_DB_NAME = 'syq-travel-planner';
+const PLAN_STORE = 'plans';
+const PLAN_MAX_AGE_MS = 24 * 60 * 60 * 1000;      // older plans are fetched again
+const PLAN_REVALIDATE_AGE_MS = 60 * 60 * 1000;    // older plans are refreshed in the background
+const PLAN_CACHE_LIMIT = 20;
+const LAST_PLAN_KEY = 'lastPlanKey';
+
+// Register the service worker that precaches the page, styles and marked.js
+if ('serviceWorker' in navigator) {
+    navigator.serviceWorker.register('/sw.js').catch(error => {
+        console.warn('Service worker registration failed:', error);
+    });
+}
+
+function openPlanDb() {
+    return new Promise((resolve, reject) => {
+        const request = indexedDB.open(PLAN_DB_NAME, 1);
+        request.onupgradeneeded = () => {
+            request.result.createObjectStore(PLAN_STORE, { keyPath: 'key' });
+        };
+        request.onsuccess = () => resolve(request.result);
+        request.onerror = () => reject(request.error);
+    });
+}
+
+async function getCachedPlan(key) {
+    try {
+        const db = await openPlanDb();
+        return await new Promise((resolve, reject) => {
+            const request = db.transaction(PLAN_STORE).objectStore(PLAN_STORE).get(key);
+            request.onsuccess = () => resolve(request.result || null);
+            request.onerror = () => reject(request.error);
+        });
+    } catch (error) {
+        return null;  // IndexedDB unavailable (e.g. private mode); just skip the cache
+    }
+}
+
+async function putCachedPlan(key, data) {
+    try {
+        const db = await openPlanDb();
+        const store = db.transaction(PLAN_STORE, 'readwrite').objectStore(PLAN_STORE);
+        store.put({ key, data, savedAt: Date.now() });
+
+        // Keep only the most recent plans
+        const all = store.getAll();
+        all.onsuccess = () => {
+            all.result
+                .sort((a, b) => b.savedAt - a.savedAt)
+                .slice(PLAN_CACHE_LIMIT)
+                .forEach(entry => store.delete(entry.key));
+        };
+        localStorage.setItem(LAST_PLAN_KEY, key);
+    } catch (error) {
+        console.warn('Could not cache travel plan:', error);
+    }
+}
+
+function planCacheKey(payload) {
+    return JSON.stringify([
+        payload.source.trim().toLowerCase(),
+        payload.destination.trim().toLowerCase(),
+        payload.start_date,
+        payload.end_date,
+        payload.budget,
+        payload.travelers,
+        payload.interests.map(interest => interest.toLowerCase()).filter(Boolean).sort(),
+        payload.include_flights
+    ]);
+}
+
+async function fetchPlan(payload) {
+    const response = await fetch('/api/generate-plan', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify(payload),
+    });
+    return { response, data: await response.json() };
+}
+
+function displayPlan(data) {
+    document.getElementById('planContent').innerHTML = marked.parse(data.plan);
+    document.getElementById('chatMessages').innerHTML = ''; // Clear previous chat messages
+    currentTravelPlan = data.plan;  // Store the travel plan
+    currentChatSession = null;
+    // Show chat box
+    document.getElementById('chatBox').classList.remove('hidden');
+
+    // Handle flight details
+    const flightDetailsDiv = document.getElementById('flightDetails');
+    if (data.flight_details) {
+        document.getElementById('flightContent').innerHTML = marked.parse(data.flight_details);
+        flightDetailsDiv.classList.remove('hidden');
+    } else {
+        flightDetailsDiv.classList.add('hidden');
+    }
+    document.getElementById('result').classList.remove('hidden');
+}
+
+document.getElementById('travelForm').addEventListener('submit', async (e) => {
+    e.preventDefault();
+
+    // Get form values
+    const payload = {
+        source: document.getElementById('source').value,
+        destination: document.getElementById('destination').value,
+        start_date: document.getElementById('startDate').value,
+        end_date: document.getElementById('endDate').value,
+        budget: parseFloat(document.getElementById('budget').value),
+        travelers: parseInt(document.getElementById('travelers').value),
+        interests: document.getElementById('interests').value.split(',').map(interest => interest.trim()),
+        include_flights: document.getElementById('includeFlights').checked
+    };
+    const cacheKey = planCacheKey(payload);
+
+    // Serve a recent plan for the same inputs straight from the browser cache
+    const cached = await getCachedPlan(cacheKey);
+    const age = cached ? Date.now() - cached.savedAt : Infinity;
+    if (age < PLAN_MAX_AGE_MS) {
+        displayPlan(cached.data);
+        localStorage.setItem(LAST_PLAN_KEY, cacheKey);
+        if (age > PLAN_REVALIDATE_AGE_MS) {
+            fetchPlan(payload).then(({ response, data }) => {
+                if (response.ok) putCachedPlan(cacheKey, data);
+            }).catch(() => {});
+        }
+        return;
+    }
+
+    // Show loading spinner
+    document.getElementById('loadingSpinner').classList.remove('hidden');
+    document.getElementById('result').classList.add('hidden');
+
+    try {
+        const { response, data } = await fetchPlan(payload);
+
+        if (response.ok) {
+            // Display the result
+            displayPlan(data);
+            putCachedPlan(cacheKey, data);
+        } else {
+            // Validation errors arrive as a list of {loc, msg} objects
+            const detail = Array.isArray(data.detail)
+                ? data.detail.map(err => err.msg).join('\n')
+                : data.detail;
+            alert('Error: ' + detail);
+        }
+    } catch (error) {
+        alert('Error connecting to the server: ' + error.message);
+    } finally {
+        // Hide loading spinner
+        document.getElementById('loadingSpinner').classList.add('hidden');
+    }
+});
+
+// Restore the last plan after a reload
+const lastPlanKey = localStorage.getItem(LAST_PLAN_KEY);
+if (lastPlanKey) {
+    getCachedPlan(lastPlanKey).then(cached => {
+        if (cached && Date.now() - cached.savedAt < PLAN_MAX_AGE_MS) {
+            displayPlan(cached.data);
+        }
+    });
+}
+
+function postChat(message) {
+    // Within a session the server already has the plan, so only send the question
+    return fetch('/api/chat', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({
+            question: message,
+            travel_plan: currentChatSession ? '' : currentTravelPlan,
+            session_id: currentChatSession
+        }),
+    });
+}
+
+async function sendMessage() {
+    const chatInput = document.getElementById('chatInput');
+    const message = chatInput.value.trim();
+    if (!message) return;
+
+    // Clear input
+    chatInput.value = '';
+
+    // Add user message to chat
+    addMessageToChat(message, true);
+
+    try {
+        let response = await postChat(message);
+        if (response.status === 404 && currentChatSession) {
+            // Session expired on the server; start a new one from the full plan
+            currentChatSession = null;
+            response = await postChat(message);
+        }
+
+        const data = await response.json();
+        if (response.ok) {
+            // Add AI response to chat
+            currentChatSession = data.session_id || null;
+            addMessageToChat(data.response, false);
+        } else {
+            addMessageToChat("Sorry, I couldn't process your question. Please try again.", false);
+        }
+    } catch (error) {
+        addMessageToChat("Error connecting to the server. Please try again.", false);
+    }
+}
+
+function addMessageToChat(message, isUser) {
+    const chatMessages = document.getElementById('chatMessages');
+    const messageDiv = document.createElement('div');
+    messageDiv.className = `message ${isUser ? 'user-message' : 'ai-message'} ${isUser ? 'user' : 'ai'}`;
+    messageDiv.innerHTML = marked.parse(message);
+    chatMessages.appendChild(messageDiv);
+    chatMessages.scrollTop = chatMessages.scrollHeight;
+}
+
+// Handle Enter key in chat input
+document.getElementById('chatInput').addEventListener('keypress', (e) => {
+    if (e.key === 'Enter') {
+        sendMessage();
+    }
+});
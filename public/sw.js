@@ -0,0 +1,50 @@
+// Service worker: precaches the app shell and serves it stale-while-revalidate
+const CACHE_NAME = 'syq-travel-planner-v1';
+const PRECACHE_URLS = [
+    '/',
+    '/styles.css',
+    '/script.js',
+    'https://cdn.jsdelivr.net/npm/marked/marked.min.js'
+];
+
+self.addEventListener('install', (event) => {
+    event.waitUntil(
+        caches.open(CACHE_NAME)
+            .then(cache => cache.addAll(PRECACHE_URLS))
+            .then(() => self.skipWaiting())
+    );
+});
+
+self.addEventListener('activate', (event) => {
+    // Drop caches left behind by older versions of this worker
+    event.waitUntil(
+        caches.keys()
+            .then(keys => Promise.all(keys.filter(key => key !== CACHE_NAME).map(key => caches.delete(key))))
+            .then(() => self.clients.claim())
+    );
+});
+
+self.addEventListener('fetch', (event) => {
+    const request = event.request;
+    if (request.method !== 'GET') return;  // API calls go straight to the network
+
+    const url = new URL(request.url);
+    const cacheUrl = url.origin === self.location.origin ? url.pathname : request.url;
+    if (!PRECACHE_URLS.includes(cacheUrl)) return;
+
+    // Answer from the cache immediately and refresh it in the background
+    event.respondWith(caches.open(CACHE_NAME).then(async (cache) => {
+        const cached = await cache.match(cacheUrl);
+        const network = fetch(request).then(response => {
+            if (response.ok) {
+                cache.put(cacheUrl, response.clone());
+            }
+            return response;
+        });
+        if (cached) {
+            event.waitUntil(network.catch(() => {}));
+            return cached;
+        }
+        return network;
+    }));
+});
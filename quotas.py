@@ -0,0 +1,282 @@
+import contextvars
+import hashlib
+import hmac
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Client the current request is attributed to, set by the quota middleware
+current_client = contextvars.ContextVar("current_client", default=None)
+
+# Token-bucket quota on Gemini tokens per client; 0 disables enforcement
+QUOTA_TOKENS_PER_MINUTE = float(os.environ.get("QUOTA_TOKENS_PER_MINUTE", 60000))
+QUOTA_BURST_TOKENS = float(os.environ.get("QUOTA_BURST_TOKENS", 120000))
+
+# Per-client SerpAPI searches (flight cache misses) per minute; 0 disables the limit
+FLIGHT_SEARCHES_PER_MINUTE = float(os.environ.get("FLIGHT_SEARCHES_PER_MINUTE", 20))
+FLIGHT_SEARCH_BURST = float(os.environ.get("FLIGHT_SEARCH_BURST", 40))
+
+USAGE_DB_PATH = os.environ.get("USAGE_DB_PATH", "usage.db")
+USAGE_FLUSH_SECONDS = float(os.environ.get("USAGE_FLUSH_SECONDS", 60))
+# Clients whose totals and buckets are kept in memory; the least recently seen are evicted
+USAGE_MAX_CLIENTS = int(os.environ.get("USAGE_MAX_CLIENTS", 10000))
+
+# Only these keys identify a client; any other X-API-Key header is ignored
+QUOTA_API_KEYS = [key.strip() for key in os.environ.get("QUOTA_API_KEYS", "").split(",") if key.strip()]
+# X-Forwarded-For is only honoured on connections from these proxy addresses ("*" for any)
+TRUSTED_PROXIES = {ip.strip() for ip in os.environ.get("TRUSTED_PROXIES", "").split(",") if ip.strip()}
+
+_untrusted_proxy_warned = False
+
+
+def _warn_untrusted_proxy(peer):
+    """Log once that forwarded requests arrive from a proxy we were not told about
+
+    Behind a platform proxy (Render, Railway) every client then shares the
+    proxy's quota, so this needs fixing in the deployment's settings.
+    """
+    global _untrusted_proxy_warned
+    if _untrusted_proxy_warned:
+        return
+    _untrusted_proxy_warned = True
+    logger.warning(
+        "X-Forwarded-For received from an untrusted peer; all such clients share one quota. "
+        "Set TRUSTED_PROXIES to the proxy address, or '*' when the app is only reachable through a proxy",
+        extra={"peer": peer},
+    )
+
+
+def _known_api_key(api_key):
+    return any(hmac.compare_digest(api_key.encode(), key.encode()) for key in QUOTA_API_KEYS)
+
+
+def client_id(request):
+    """Identify the caller by a configured API key, otherwise by client IP
+
+    Both headers are client-controlled, so an unknown key is ignored and
+    X-Forwarded-For is only read when the connection comes from a trusted
+    proxy. The client is then the nearest forwarded address that is not one
+    of our own proxies.
+    """
+    api_key = request.headers.get("x-api-key")
+    if api_key and _known_api_key(api_key):
+        return "key:" + hashlib.sha256(api_key.encode()).hexdigest()[:16]
+    peer = request.client.host if request.client else "unknown"
+    if peer in TRUSTED_PROXIES or "*" in TRUSTED_PROXIES:
+        forwarded = [ip.strip() for ip in request.headers.get("x-forwarded-for", "").split(",") if ip.strip()]
+        for ip in reversed(forwarded):
+            if ip not in TRUSTED_PROXIES:
+                return "ip:" + ip
+    elif "x-forwarded-for" in request.headers:
+        _warn_untrusted_proxy(peer)
+    return "ip:" + peer
+
+
+class TokenBucket:
+    """Token bucket that may go into debt when a call costs more than expected"""
+
+    def __init__(self, capacity, refill_per_second):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.level = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.refill_per_second)
+        self.updated_at = now
+
+    def available(self):
+        self._refill()
+        return self.level
+
+    def consume(self, amount):
+        self._refill()
+        self.level -= amount
+
+    def retry_after(self):
+        """Seconds until the bucket is positive again"""
+        self._refill()
+        if self.level > 0:
+            return 0.0
+        return (1 - self.level) / self.refill_per_second
+
+
+class RateLimiter:
+    """Per-client token buckets for a cost counted in calls, such as paid searches
+
+    Like the token quota, a request is admitted while the client's bucket
+    is positive and the calls it actually makes are charged afterwards.
+    """
+
+    def __init__(self, per_minute=FLIGHT_SEARCHES_PER_MINUTE, burst=FLIGHT_SEARCH_BURST, max_clients=USAGE_MAX_CLIENTS):
+        self.per_minute = per_minute
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.per_minute > 0
+
+    def _bucket(self, client):
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = self._buckets[client] = TokenBucket(self.burst, self.per_minute / 60)
+        self._buckets.move_to_end(client)
+        while len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        return bucket
+
+    def check(self, client):
+        """Seconds the client must wait before its next call, 0 if allowed now"""
+        if not self.enabled:
+            return 0.0
+        with self._lock:
+            return self._bucket(client).retry_after()
+
+    def consume(self, client, amount=1):
+        if client is None or not self.enabled:
+            return
+        with self._lock:
+            self._bucket(client).consume(amount)
+
+
+class UsageTracker:
+    """Per-client token and latency accounting with token-bucket quotas
+
+    Totals are kept in memory and the deltas since the last flush are
+    written to SQLite periodically, so the hot path never touches disk.
+    """
+
+    def __init__(self, tokens_per_minute=QUOTA_TOKENS_PER_MINUTE, burst_tokens=QUOTA_BURST_TOKENS, db_path=USAGE_DB_PATH,
+                 max_clients=USAGE_MAX_CLIENTS):
+        self.tokens_per_minute = tokens_per_minute
+        self.burst_tokens = burst_tokens
+        self.db_path = db_path
+        self.max_clients = max_clients
+        self._totals = OrderedDict()
+        self._pending = {}
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.tokens_per_minute > 0
+
+    def _bucket(self, client):
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = self._buckets[client] = TokenBucket(self.burst_tokens, self.tokens_per_minute / 60)
+        self._evict(self._buckets, client)
+        return bucket
+
+    def _evict(self, store, client):
+        """Mark ``client`` as recently seen and drop the least recently seen beyond max_clients"""
+        store.move_to_end(client)
+        while len(store) > self.max_clients:
+            store.popitem(last=False)
+
+    def check(self, client):
+        """Seconds the client must wait before its next call, 0 if allowed now"""
+        if not self.enabled:
+            return 0.0
+        with self._lock:
+            return self._bucket(client).retry_after()
+
+    def _add(self, store, client, requests=0, prompt_tokens=0, response_tokens=0, latency=0.0):
+        usage = store.setdefault(client, {
+            "requests": 0,
+            "prompt_tokens": 0,
+            "response_tokens": 0,
+            "total_latency": 0.0,
+        })
+        usage["requests"] += requests
+        usage["prompt_tokens"] += prompt_tokens
+        usage["response_tokens"] += response_tokens
+        usage["total_latency"] += latency
+        # Pending deltas are cleared on every flush; lifetime totals live in SQLite
+        if store is self._totals:
+            self._evict(store, client)
+
+    def record_tokens(self, client, prompt_tokens, response_tokens):
+        """Charge Gemini tokens to a client"""
+        if client is None:
+            return
+        with self._lock:
+            for store in (self._totals, self._pending):
+                self._add(store, client, prompt_tokens=prompt_tokens, response_tokens=response_tokens)
+            if self.enabled:
+                self._bucket(client).consume(prompt_tokens + response_tokens)
+
+    def record_request(self, client, latency):
+        """Count one request and its end-to-end latency"""
+        with self._lock:
+            for store in (self._totals, self._pending):
+                self._add(store, client, requests=1, latency=latency)
+
+    def usage(self, client):
+        """Usage since startup and remaining quota for one client"""
+        with self._lock:
+            usage = dict(self._totals.get(client, {}))
+            if self.enabled:
+                bucket = self._bucket(client)
+                usage["quota_remaining_tokens"] = max(int(bucket.available()), 0)
+                usage["quota_tokens_per_minute"] = self.tokens_per_minute
+            return usage
+
+    def flush(self):
+        """Write usage accumulated since the last flush to SQLite"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            # Drop buckets that have refilled completely; they hold no state
+            for client in [c for c, b in self._buckets.items() if b.available() >= b.capacity]:
+                del self._buckets[client]
+        if not pending:
+            return
+
+        try:
+            self._write(pending)
+        except sqlite3.Error:
+            # Keep the deltas so the next flush retries them
+            with self._lock:
+                for client, u in pending.items():
+                    self._add(self._pending, client, u["requests"], u["prompt_tokens"], u["response_tokens"], u["total_latency"])
+            raise
+
+    def _write(self, pending):
+        now = time.time()
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS client_usage (
+                    client TEXT PRIMARY KEY,
+                    requests INTEGER NOT NULL,
+                    prompt_tokens INTEGER NOT NULL,
+                    response_tokens INTEGER NOT NULL,
+                    total_latency REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )"""
+            )
+            conn.executemany(
+                """INSERT INTO client_usage VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(client) DO UPDATE SET
+                    requests = requests + excluded.requests,
+                    prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+                    response_tokens = response_tokens + excluded.response_tokens,
+                    total_latency = total_latency + excluded.total_latency,
+                    updated_at = excluded.updated_at""",
+                [
+                    (client, u["requests"], u["prompt_tokens"], u["response_tokens"], u["total_latency"], now)
+                    for client, u in pending.items()
+                ],
+            )
+            conn.commit()
+        finally:
+            conn.close()
@@ -0,0 +1,109 @@
+import os
+import threading
+
+import google.generativeai as genai
+
+# Model tiers, cheapest first
+FAST_MODEL = os.environ.get("GEMINI_FAST_MODEL", "gemini-1.5-flash-8b")
+DEFAULT_MODEL = os.environ.get("GEMINI_MODEL", "gemini-1.5-flash")
+LARGE_MODEL = os.environ.get("GEMINI_LARGE_MODEL", "gemini-1.5-pro")
+
+# Size thresholds used to pick a tier
+CHAT_FAST_MAX_CHARS = int(os.environ.get("CHAT_FAST_MAX_CHARS", 200))
+PLAN_LARGE_MIN_DAYS = int(os.environ.get("PLAN_LARGE_MIN_DAYS", 8))
+
+# Rough characters-per-token ratio, used when the SDK reports no usage
+_CHARS_PER_TOKEN = 4
+
+
+def _estimate_tokens(text):
+    return max(len(text) // _CHARS_PER_TOKEN, 1) if text else 0
+
+
+def _response_text(response):
+    if response is None:
+        return ""
+    try:
+        return response.text
+    except Exception:
+        # Blocked or empty candidates make .text raise
+        return ""
+
+
+class ModelRouter:
+    """Pick a Gemini model per endpoint and request size, and track its usage
+
+    Short chat questions go to the fast tier, long itineraries to the large
+    tier and everything else to the default model. Setting GEMINI_CHAT_MODEL,
+    GEMINI_PLAN_MODEL or GEMINI_LEGACY_MODEL pins an endpoint to one model.
+    """
+
+    def __init__(self, fast_model=FAST_MODEL, default_model=DEFAULT_MODEL, large_model=LARGE_MODEL):
+        self.fast_model = fast_model
+        self.default_model = default_model
+        self.large_model = large_model
+        self.overrides = {
+            "chat": os.environ.get("GEMINI_CHAT_MODEL"),
+            "plan": os.environ.get("GEMINI_PLAN_MODEL"),
+            "legacy": os.environ.get("GEMINI_LEGACY_MODEL"),
+        }
+        self._models = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def pick(self, endpoint, question="", trip_days=0):
+        """Name of the model to use for a request"""
+        override = self.overrides.get(endpoint)
+        if override:
+            return override
+        if endpoint == "chat" and len(question) <= CHAT_FAST_MAX_CHARS:
+            return self.fast_model
+        if endpoint in ("plan", "legacy") and trip_days >= PLAN_LARGE_MIN_DAYS:
+            return self.large_model
+        return self.default_model
+
+    def get_model(self, name):
+        """Shared GenerativeModel instance for a model name"""
+        with self._lock:
+            if name not in self._models:
+                self._models[name] = genai.GenerativeModel(name)
+            return self._models[name]
+
+    def record(self, name, latency, prompt, response=None, error=False):
+        """Record latency and token counts for one call"""
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            prompt_tokens = usage.prompt_token_count
+            response_tokens = usage.candidates_token_count
+        else:
+            prompt_tokens = _estimate_tokens(prompt)
+            response_tokens = _estimate_tokens(_response_text(response))
+
+        with self._lock:
+            stats = self._stats.setdefault(name, {
+                "requests": 0,
+                "errors": 0,
+                "total_latency": 0.0,
+                "prompt_tokens": 0,
+                "response_tokens": 0,
+            })
+            stats["requests"] += 1
+            stats["errors"] += int(error)
+            stats["total_latency"] += latency
+            stats["prompt_tokens"] += prompt_tokens
+            stats["response_tokens"] += response_tokens
+        return prompt_tokens, response_tokens
+
+    def stats(self):
+        """Per-model request counts, latency and token usage"""
+        with self._lock:
+            return {
+                name: {
+                    "requests": s["requests"],
+                    "errors": s["errors"],
+                    "avg_latency_ms": round(s["total_latency"] / s["requests"] * 1000, 1),
+                    "prompt_tokens": s["prompt_tokens"],
+                    "response_tokens": s["response_tokens"],
+                }
+                for name, s in self._stats.items()
+            }
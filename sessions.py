@@ -0,0 +1,193 @@
+import asyncio
+import datetime
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+import google.generativeai as genai
+
+from answers import plan_fingerprint
+
+logger = logging.getLogger(__name__)
+
+CHAT_SESSION_MAX = int(os.environ.get("CHAT_SESSION_MAX", 500))
+CHAT_SESSION_TTL_SECONDS = float(os.environ.get("CHAT_SESSION_TTL_SECONDS", 3600))
+# Question/answer exchanges kept in a session's history; older ones are dropped
+CHAT_HISTORY_MAX_TURNS = int(os.environ.get("CHAT_HISTORY_MAX_TURNS", 6))
+
+# Gemini only caches prompts above a minimum size; smaller plans use plain history
+CONTEXT_CACHE_MIN_TOKENS = int(os.environ.get("CONTEXT_CACHE_MIN_TOKENS", 32768))
+# Context caching needs an explicitly versioned model name
+CONTEXT_CACHE_MODEL = os.environ.get("CONTEXT_CACHE_MODEL", "models/gemini-1.5-flash-001")
+
+CHAT_INSTRUCTIONS = """You answer questions about the travel plan below.
+Provide clear and concise responses, using markdown formatting where appropriate.
+If a question is about something not covered in the plan, suggest relevant information or alternatives."""
+
+
+def plan_prefix(travel_plan):
+    return f"{CHAT_INSTRUCTIONS}\n\nTravel plan:\n{travel_plan}"
+
+
+def _create_cached_content(travel_plan, ttl_seconds):
+    """Upload the plan to Gemini's context cache"""
+    return genai.caching.CachedContent.create(
+        model=CONTEXT_CACHE_MODEL,
+        system_instruction=CHAT_INSTRUCTIONS,
+        contents=[travel_plan],
+        ttl=datetime.timedelta(seconds=ttl_seconds),
+    )
+
+
+class ChatSessionEntry:
+    """One conversation about a plan, plus the lock serializing its turns"""
+
+    def __init__(self, session_id, chat, model_name, plan_fingerprint, cached_content=None,
+                 max_turns=CHAT_HISTORY_MAX_TURNS):
+        self.session_id = session_id
+        self.plan_fingerprint = plan_fingerprint
+        self.chat = chat
+        self.model_name = model_name
+        self.cached_content = cached_content
+        self.max_turns = max_turns
+        # Without context caching the history starts with the plan and an acknowledgement
+        self.prefix_length = 0 if cached_content is not None else 2
+        self.lock = asyncio.Lock()
+        self.turns = 0
+        self.created = self.last_used = time.monotonic()
+
+    def finish_turn(self):
+        """Count a completed turn and drop exchanges beyond ``max_turns`` from the history"""
+        self.turns += 1
+        history = list(self.chat.history)
+        keep = self.max_turns * 2
+        if len(history) > self.prefix_length + keep:
+            self.chat.history = history[:self.prefix_length] + history[len(history) - keep:]
+
+    def discard_failed_turn(self):
+        """Drop a turn whose streamed reply failed; False when the chat cannot be repaired
+
+        The SDK keeps a stream that broke part-way, e.g. on a safety stop, as
+        the last reply, and every later turn fails reading the history until
+        it is rewound.
+        """
+        try:
+            self.chat.history
+            return True
+        except Exception:
+            pass
+        try:
+            self.chat.rewind()
+            return True
+        except Exception:
+            return False
+
+
+class ChatSessionStore:
+    """Bounded LRU of chat sessions keyed by session ID
+
+    Each session holds an SDK chat object, so clients only send the new
+    question while the server keeps the history. The SDK still sends the
+    whole history to Gemini on every turn, so only the last
+    CHAT_HISTORY_MAX_TURNS exchanges are kept: per-turn input is bounded by
+    the plan plus that window instead of growing with the conversation.
+
+    Gemini context caching, which stops the plan itself from being
+    re-processed, only applies above CONTEXT_CACHE_MIN_TOKENS. That is the
+    API's minimum cacheable size and is larger than a typical generated
+    plan, so most sessions use plain history.
+
+    ``get_model`` maps a model name to an object with ``start_chat``;
+    ``create_cache`` and ``cached_model`` create a context cache and a model
+    bound to it. All three can be replaced by local stubs in tests.
+    """
+
+    def __init__(self, get_model, max_sessions=CHAT_SESSION_MAX, ttl_seconds=CHAT_SESSION_TTL_SECONDS,
+                 estimate_tokens=None, create_cache=None, cached_model=None):
+        self.get_model = get_model
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.estimate_tokens = estimate_tokens or (lambda text: len(text) // 4)
+        self.create_cache = create_cache or _create_cached_content
+        self.cached_model = cached_model or (
+            lambda cached_content: genai.GenerativeModel.from_cached_content(cached_content=cached_content))
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.context_cached = 0
+
+    def get(self, session_id):
+        """Live session for ``session_id`` or None if unknown or expired"""
+        if not session_id:
+            return None
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            now = time.monotonic()
+            idle_expired = now - entry.last_used > self.ttl_seconds
+            # The upstream context cache expires a fixed time after creation
+            cache_expired = entry.cached_content is not None and now - entry.created > self.ttl_seconds
+            if idle_expired or cache_expired:
+                del self._sessions[session_id]
+                self._release(entry)
+                return None
+            entry.last_used = now
+            self._sessions.move_to_end(session_id)
+            return entry
+
+    def create(self, travel_plan, model_name):
+        """Start a new session about ``travel_plan``"""
+        cached_content = self._cache_plan(travel_plan)
+        if cached_content is not None:
+            model_name = CONTEXT_CACHE_MODEL.split("/")[-1]
+            chat = self.cached_model(cached_content).start_chat()
+        else:
+            chat = self.get_model(model_name).start_chat(history=[
+                {"role": "user", "parts": [plan_prefix(travel_plan)]},
+                {"role": "model", "parts": ["Understood. Ask me anything about this travel plan."]},
+            ])
+
+        entry = ChatSessionEntry(
+            secrets.token_urlsafe(16), chat, model_name, plan_fingerprint(travel_plan), cached_content)
+        with self._lock:
+            self._sessions[entry.session_id] = entry
+            while len(self._sessions) > self.max_sessions:
+                _, evicted = self._sessions.popitem(last=False)
+                self._release(evicted)
+        return entry
+
+    def _cache_plan(self, travel_plan):
+        """Upload the plan prefix to Gemini's context cache when it is worth it"""
+        if self.estimate_tokens(plan_prefix(travel_plan)) < CONTEXT_CACHE_MIN_TOKENS:
+            return None
+        try:
+            cached_content = self.create_cache(travel_plan, self.ttl_seconds)
+        except Exception as e:
+            logger.warning("Context caching unavailable, using chat history", extra={"error": repr(e)})
+            return None
+        self.context_cached += 1
+        return cached_content
+
+    def _release(self, entry):
+        if entry.cached_content is None:
+            return
+        # Deleting is a network call, so keep it off the request path
+        threading.Thread(target=self._delete_cached_content, args=(entry.cached_content,), daemon=True).start()
+
+    @staticmethod
+    def _delete_cached_content(cached_content):
+        try:
+            cached_content.delete()
+        except Exception:
+            logger.exception("Error deleting cached context")
+
+    def stats(self):
+        return {
+            "active_sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "ttl_seconds": self.ttl_seconds,
+            "context_cached_sessions": self.context_cached,
+        }
@@ -1,118 +1,529 @@
-// Initialize travel plan variable
-let currentTravelPlan = "";
-
-document.getElementById('travelForm').addEventListener('submit', async (e) => {
-    e.preventDefault();
-
-    // Show loading spinner
-    document.getElementById('loadingSpinner').classList.remove('hidden');
-    document.getElementById('result').classList.add('hidden');
-
-    // Get form values
-    const source = document.getElementById('source').value;
-    const destination = document.getElementById('destination').value;
-    const startDate = document.getElementById('startDate').value;
-    const endDate = document.getElementById('endDate').value;
-    const budget = parseFloat(document.getElementById('budget').value);
-    const travelers = parseInt(document.getElementById('travelers').value);
-    const interests = document.getElementById('interests').value.split(',').map(interest => interest.trim());
-    const includeFlights = document.getElementById('includeFlights').checked;
-
-    try {
-        const response = await fetch('/generate-plan', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({
-                source,
-                destination,
-                start_date: startDate,
-                end_date: endDate,
-                budget,
-                travelers,
-                interests,
-                include_flights: includeFlights
-            }),
-        });
-
-        const data = await response.json();
-
-        if (response.ok) {
-            // Display the result
-            document.getElementById('planContent').innerHTML = marked.parse(data.plan);
-            document.getElementById('chatMessages').innerHTML = ''; // Clear previous chat messages
-            currentTravelPlan = data.plan;  // Store the travel plan
-            // Show chat box
-            document.getElementById('chatBox').classList.remove('hidden');
-            
-            // Handle flight details
-            const flightDetailsDiv = document.getElementById('flightDetails');
-            if (data.flight_details) {
-                document.getElementById('flightContent').innerHTML = marked.parse(data.flight_details);
-                flightDetailsDiv.classList.remove('hidden');
-            } else {
-                flightDetailsDiv.classList.add('hidden');
-            }
-            document.getElementById('result').classList.remove('hidden');
-        } else {
-            alert('Error: ' + data.detail);
-        }
-    } catch (error) {
-        alert('Error connecting to the server: ' + error.message);
-    } finally {
-        // Hide loading spinner
-        document.getElementById('loadingSpinner').classList.add('hidden');
-    }
-});
-
-async function sendMessage() {
-    const chatInput = document.getElementById('chatInput');
-    const message = chatInput.value.trim();
-    if (!message) return;
-
-    // Clear input
-    chatInput.value = '';
-
-    // Add user message to chat
-    addMessageToChat(message, true);
-
-    try {
-        const response = await fetch('/chat', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({
-                question: message,
-                travel_plan: currentTravelPlan
-            }),
-        });
-
-        const data = await response.json();
-        if (response.ok) {
-            // Add AI response to chat
-            addMessageToChat(data.response, false);
-        } else {
-            addMessageToChat("Sorry, I couldn't process your question. Please try again.", false);
-        }
-    } catch (error) {
-        addMessageToChat("Error connecting to the server. Please try again.", false);
-    }
-}
-
-function addMessageToChat(message, isUser) {
-    const chatMessages = document.getElementById('chatMessages');
-    const messageDiv = document.createElement('div');
-    messageDiv.className = `message ${isUser ? 'user-message' : 'ai-message'} ${isUser ? 'user' : 'ai'}`;
-    messageDiv.innerHTML = marked.parse(message);
-    chatMessages.appendChild(messageDiv);
-    chatMessages.scrollTop = chatMessages.scrollHeight;
-}
-
-// Handle Enter key in chat input
-document.getElementById('chatInput').addEventListener('keypress', (e) => {
-    if (e.key === 'Enter') {
-        sendMessage();
-    }
-});
+// Initialize travel plan variable
+let currentTravelPlan = "";
+let currentChatSession = null;  // server-side chat session about the current plan
+
+// Live connection that streams plans and answers; HTTP is used whenever it is unavailable
+let liveSocket = null;
+let livePending = null;     // handlers for the request in flight on the socket
+let liveHasPlan = false;    // whether the connection already knows the displayed plan
+let liveFlightsFor = null;  // plan still waiting for its flight results
+
+// Flight options are sorted, filtered and paged by the server from its cached search
+const FLIGHT_PAGE_SIZE = 10;
+const FARE_CALENDAR_DAYS = 3;  // nearby dates compared on each side of the travel date
+let flightQuery = null;     // route and date of the flights being shown
+let flightOffset = 0;
+let fareCalendarRequest = 0;  // only the latest calendar request is displayed
+
+// Browser-side plan cache (IndexedDB), keyed on the normalized form inputs
+const PLAN_DB_NAME = 'syq-travel-planner';
+const PLAN_STORE = 'plans';
+const PLAN_MAX_AGE_MS = 24 * 60 * 60 * 1000;      // older plans are fetched again
+const PLAN_REVALIDATE_AGE_MS = 60 * 60 * 1000;    // older plans are refreshed in the background
+const PLAN_CACHE_LIMIT = 20;
+const LAST_PLAN_KEY = 'lastPlanKey';
+
+// Register the service worker that precaches the page, styles and marked.js
+if ('serviceWorker' in navigator) {
+    navigator.serviceWorker.register('/sw.js').catch(error => {
+        console.warn('Service worker registration failed:', error);
+    });
+}
+
+function openPlanDb() {
+    return new Promise((resolve, reject) => {
+        const request = indexedDB.open(PLAN_DB_NAME, 1);
+        request.onupgradeneeded = () => {
+            request.result.createObjectStore(PLAN_STORE, { keyPath: 'key' });
+        };
+        request.onsuccess = () => resolve(request.result);
+        request.onerror = () => reject(request.error);
+    });
+}
+
+async function getCachedPlan(key) {
+    try {
+        const db = await openPlanDb();
+        return await new Promise((resolve, reject) => {
+            const request = db.transaction(PLAN_STORE).objectStore(PLAN_STORE).get(key);
+            request.onsuccess = () => resolve(request.result || null);
+            request.onerror = () => reject(request.error);
+        });
+    } catch (error) {
+        return null;  // IndexedDB unavailable (e.g. private mode); just skip the cache
+    }
+}
+
+async function putCachedPlan(key, data) {
+    try {
+        const db = await openPlanDb();
+        const store = db.transaction(PLAN_STORE, 'readwrite').objectStore(PLAN_STORE);
+        store.put({ key, data, savedAt: Date.now() });
+
+        // Keep only the most recent plans
+        const all = store.getAll();
+        all.onsuccess = () => {
+            all.result
+                .sort((a, b) => b.savedAt - a.savedAt)
+                .slice(PLAN_CACHE_LIMIT)
+                .forEach(entry => store.delete(entry.key));
+        };
+        localStorage.setItem(LAST_PLAN_KEY, key);
+    } catch (error) {
+        console.warn('Could not cache travel plan:', error);
+    }
+}
+
+function planCacheKey(payload) {
+    return JSON.stringify([
+        payload.source.trim().toLowerCase(),
+        payload.destination.trim().toLowerCase(),
+        payload.start_date,
+        payload.end_date,
+        payload.budget,
+        payload.travelers,
+        payload.interests.map(interest => interest.toLowerCase()).filter(Boolean).sort(),
+        payload.include_flights
+    ]);
+}
+
+async function fetchPlan(payload) {
+    const response = await fetch('/generate-plan', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify(payload),
+    });
+    return { response, data: await response.json() };
+}
+
+function displayPlan(data) {
+    document.getElementById('planContent').innerHTML = marked.parse(data.plan);
+    document.getElementById('chatMessages').innerHTML = ''; // Clear previous chat messages
+    currentTravelPlan = data.plan;  // Store the travel plan
+    currentChatSession = null;
+    liveHasPlan = false;
+    liveFlightsFor = null;
+    // Show chat box
+    document.getElementById('chatBox').classList.remove('hidden');
+
+    displayFlights(data);
+    document.getElementById('result').classList.remove('hidden');
+}
+
+function displayFlights(data) {
+    // Plans cached before flight queries existed have no flight_query; skip their flights
+    flightQuery = data.flight_details && data.flight_query ? data.flight_query : null;
+    flightOffset = 0;
+    if (flightQuery) {
+        document.getElementById('flightDetails').classList.remove('hidden');
+        loadFlights();
+        // Each nearby date may cost a flight search, so the calendar is only loaded on request
+        fareCalendarRequest++;
+        document.getElementById('fareCalendar').classList.add('hidden');
+        document.getElementById('fareCalendarButton').classList.remove('hidden');
+    } else {
+        document.getElementById('flightDetails').classList.add('hidden');
+    }
+}
+
+async function loadFlights() {
+    const query = flightQuery;
+    const [sort, order] = document.getElementById('flightSort').value.split(':');
+    const params = new URLSearchParams({ ...query, sort, order, offset: flightOffset, limit: FLIGHT_PAGE_SIZE });
+    const maxStops = document.getElementById('flightMaxStops').value;
+    const maxPrice = document.getElementById('flightMaxPrice').value;
+    if (maxStops) params.set('max_stops', maxStops);
+    if (maxPrice > 0) params.set('max_price', maxPrice);
+
+    const flightContent = document.getElementById('flightContent');
+    const controls = document.getElementById('flightControls');
+    try {
+        const response = await fetch('/flights?' + params);
+        const data = await response.json();
+        if (query !== flightQuery) return;  // a newer plan replaced these flights
+        if (!response.ok) {
+            controls.classList.add('hidden');
+            flightContent.innerHTML = marked.parse(errorDetail(data) || 'Flight options are unavailable.');
+            return;
+        }
+        controls.classList.remove('hidden');
+        flightContent.innerHTML = marked.parse(formatFlightsMarkdown(data));
+        const last = Math.min(data.offset + data.limit, data.total);
+        document.getElementById('flightPageInfo').textContent =
+            data.total ? `${data.offset + 1}-${last} of ${data.total}` : '';
+        document.getElementById('flightPrev').disabled = data.offset === 0;
+        document.getElementById('flightNext').disabled = last >= data.total;
+    } catch (error) {
+        flightContent.innerHTML = marked.parse('Could not load flight options.');
+    }
+}
+
+async function loadFareCalendar(query) {
+    // One request searches all nearby dates in parallel on the server
+    const calendar = document.getElementById('fareCalendar');
+    const requestId = ++fareCalendarRequest;
+    calendar.classList.add('hidden');
+    try {
+        const params = new URLSearchParams({ ...query, days: FARE_CALENDAR_DAYS });
+        const response = await fetch('/fare-calendar?' + params);
+        if (requestId !== fareCalendarRequest) return;
+        if (!response.ok) {
+            // Let the user try again, e.g. after a 429
+            document.getElementById('fareCalendarButton').classList.remove('hidden');
+            return;
+        }
+        const data = await response.json();
+        calendar.innerHTML = '';
+        data.days.forEach(day => {
+            const button = document.createElement('button');
+            button.type = 'button';
+            button.dataset.date = day.date;
+            button.classList.toggle('selected', day.date === flightQuery.date);
+            button.classList.toggle('cheapest', day.date === data.cheapest_date);
+            const price = day.min_price != null ? '₹' + day.min_price.toLocaleString('en-IN') : '-';
+            button.textContent = `${day.date.slice(5)} ${price}`;
+            button.title = day.median_price != null
+                ? `Median ₹${day.median_price.toLocaleString('en-IN')} across ${day.options} options`
+                : 'No fares found';
+            button.addEventListener('click', () => showFlightsForDate(day.date));
+            calendar.appendChild(button);
+        });
+        calendar.classList.remove('hidden');
+    } catch (error) {
+        // The calendar is optional; the flight table still works without it
+        if (requestId === fareCalendarRequest) {
+            document.getElementById('fareCalendarButton').classList.remove('hidden');
+        }
+    }
+}
+
+function showFlightsForDate(date) {
+    flightQuery = { ...flightQuery, date };
+    document.querySelectorAll('#fareCalendar button').forEach(button => {
+        button.classList.toggle('selected', button.dataset.date === date);
+    });
+    reloadFlights();
+}
+
+function formatDuration(minutes) {
+    if (minutes == null) return '-';
+    return `${Math.floor(minutes / 60)}h ${minutes % 60}m`;
+}
+
+function formatFlightsMarkdown(data) {
+    if (!data.flights.length) return 'No flights match these filters.';
+    const rows = data.flights.map(flight => {
+        const stops = flight.stops
+            ? `${flight.stops} (${flight.layovers.join(', ')})`
+            : 'Non-stop';
+        const price = flight.price != null ? '₹' + flight.price.toLocaleString('en-IN') : '-';
+        return `| ${flight.airline || '-'} | ${flight.flight_numbers.join(', ')} | ` +
+            `${flight.departure_time || '-'} | ${flight.arrival_time || '-'} | ` +
+            `${formatDuration(flight.duration_minutes)} | ${stops} | ${price} |`;
+    });
+    return [
+        '| Airline | Flight(s) | Departure | Arrival | Duration | Stops | Price |',
+        '|---------|-----------|-----------|---------|----------|-------|-------|',
+        ...rows
+    ].join('\n');
+}
+
+function reloadFlights() {
+    flightOffset = 0;
+    if (flightQuery) loadFlights();
+}
+
+document.getElementById('fareCalendarButton').addEventListener('click', (e) => {
+    e.target.classList.add('hidden');
+    loadFareCalendar(flightQuery);
+});
+document.getElementById('flightSort').addEventListener('change', reloadFlights);
+document.getElementById('flightMaxStops').addEventListener('change', reloadFlights);
+document.getElementById('flightMaxPrice').addEventListener('change', reloadFlights);
+document.getElementById('flightPrev').addEventListener('click', () => {
+    flightOffset = Math.max(flightOffset - FLIGHT_PAGE_SIZE, 0);
+    loadFlights();
+});
+document.getElementById('flightNext').addEventListener('click', () => {
+    flightOffset += FLIGHT_PAGE_SIZE;
+    loadFlights();
+});
+
+function errorDetail(data) {
+    // Validation errors arrive as a list of {loc, msg} objects
+    return Array.isArray(data.detail)
+        ? data.detail.map(err => err.msg).join('\n')
+        : data.detail;
+}
+
+function connectLive() {
+    if (!('WebSocket' in window)) return;
+    const protocol = location.protocol === 'https:' ? 'wss:' : 'ws:';
+    const socket = new WebSocket(`${protocol}//${location.host}/ws`);
+    socket.onopen = () => {
+        liveSocket = socket;
+        liveHasPlan = false;  // a new connection starts without a plan
+    };
+    socket.onmessage = event => handleLiveMessage(socket, JSON.parse(event.data));
+    socket.onclose = () => {
+        if (liveSocket === socket) liveSocket = null;
+        if (livePending) {
+            livePending.fail({ detail: 'Connection lost. Please try again.' });
+            livePending = null;
+        }
+        setTimeout(connectLive, 5000);
+    };
+}
+
+function sendLive(message, handlers) {
+    // One request at a time on the socket; anything else goes over HTTP
+    if (!liveSocket || liveSocket.readyState !== WebSocket.OPEN || livePending) return false;
+    livePending = handlers;
+    liveSocket.send(JSON.stringify(message));
+    return true;
+}
+
+function handleLiveMessage(socket, message) {
+    if (message.type === 'ping') {
+        socket.send(JSON.stringify({ type: 'pong' }));
+        return;
+    }
+    if (message.type === 'flights') {
+        // Flight results can arrive after the plan; keep the browser cache complete too
+        if (liveFlightsFor) {
+            const data = { ...liveFlightsFor.data, flight_details: message.flight_details };
+            displayFlights(data);
+            putCachedPlan(liveFlightsFor.key, data);
+            liveFlightsFor = null;
+        }
+        return;
+    }
+    const pending = livePending;
+    if (!pending) return;
+    if (message.type === 'plan_chunk' || message.type === 'chat_chunk') {
+        pending.chunk(message.text);
+        return;
+    }
+    livePending = null;
+    if (message.type === 'error') {
+        pending.fail(message);
+    } else {
+        pending.done(message);
+    }
+}
+
+function renderLater(render) {
+    // Re-render streamed markdown at most once per frame
+    let scheduled = false;
+    return () => {
+        if (scheduled) return;
+        scheduled = true;
+        requestAnimationFrame(() => {
+            scheduled = false;
+            render();
+        });
+    };
+}
+
+function generateLive(payload, cacheKey) {
+    let text = '';
+    const hideSpinner = () => document.getElementById('loadingSpinner').classList.add('hidden');
+    const render = renderLater(() => {
+        if (!livePending) return;  // the finished plan has already been displayed
+        document.getElementById('planContent').innerHTML = marked.parse(text);
+    });
+    return sendLive({ type: 'plan', request: payload }, {
+        chunk(part) {
+            if (!text) {
+                hideSpinner();
+                document.getElementById('chatBox').classList.add('hidden');
+                document.getElementById('flightDetails').classList.add('hidden');
+                document.getElementById('result').classList.remove('hidden');
+            }
+            text += part;
+            render();
+        },
+        done(data) {
+            hideSpinner();
+            displayPlan(data);
+            liveHasPlan = true;
+            putCachedPlan(cacheKey, data);
+            if (payload.include_flights && !data.flight_details) {
+                liveFlightsFor = { key: cacheKey, data };
+            }
+        },
+        fail(error) {
+            hideSpinner();
+            alert('Error: ' + errorDetail(error));
+        }
+    });
+}
+
+function askLive(message) {
+    let text = '';
+    let messageDiv = null;
+    const show = content => {
+        if (messageDiv) {
+            messageDiv.innerHTML = marked.parse(content);
+            const chatMessages = document.getElementById('chatMessages');
+            chatMessages.scrollTop = chatMessages.scrollHeight;
+        } else {
+            messageDiv = addMessageToChat(content, false);
+        }
+    };
+    const render = renderLater(() => {
+        if (livePending) show(text);
+    });
+    return sendLive({
+        type: 'chat',
+        question: message,
+        travel_plan: liveHasPlan ? '' : currentTravelPlan
+    }, {
+        chunk(part) {
+            text += part;
+            render();
+        },
+        done(data) {
+            liveHasPlan = true;
+            show(data.response);
+        },
+        fail() {
+            show("Sorry, I couldn't process your question. Please try again.");
+        }
+    });
+}
+
+connectLive();
+
+document.getElementById('travelForm').addEventListener('submit', async (e) => {
+    e.preventDefault();
+
+    // Get form values
+    const payload = {
+        source: document.getElementById('source').value,
+        destination: document.getElementById('destination').value,
+        start_date: document.getElementById('startDate').value,
+        end_date: document.getElementById('endDate').value,
+        budget: parseFloat(document.getElementById('budget').value),
+        travelers: parseInt(document.getElementById('travelers').value),
+        interests: document.getElementById('interests').value.split(',').map(interest => interest.trim()),
+        include_flights: document.getElementById('includeFlights').checked
+    };
+    const cacheKey = planCacheKey(payload);
+
+    // Serve a recent plan for the same inputs straight from the browser cache
+    const cached = await getCachedPlan(cacheKey);
+    const age = cached ? Date.now() - cached.savedAt : Infinity;
+    if (age < PLAN_MAX_AGE_MS) {
+        displayPlan(cached.data);
+        localStorage.setItem(LAST_PLAN_KEY, cacheKey);
+        if (age > PLAN_REVALIDATE_AGE_MS) {
+            fetchPlan(payload).then(({ response, data }) => {
+                if (response.ok) putCachedPlan(cacheKey, data);
+            }).catch(() => {});
+        }
+        return;
+    }
+
+    // Show loading spinner
+    document.getElementById('loadingSpinner').classList.remove('hidden');
+    document.getElementById('result').classList.add('hidden');
+
+    // Stream the plan over the live connection when it is open
+    if (generateLive(payload, cacheKey)) return;
+
+    try {
+        const { response, data } = await fetchPlan(payload);
+
+        if (response.ok) {
+            // Display the result
+            displayPlan(data);
+            putCachedPlan(cacheKey, data);
+        } else {
+            alert('Error: ' + errorDetail(data));
+        }
+    } catch (error) {
+        alert('Error connecting to the server: ' + error.message);
+    } finally {
+        // Hide loading spinner
+        document.getElementById('loadingSpinner').classList.add('hidden');
+    }
+});
+
+// Restore the last plan after a reload
+const lastPlanKey = localStorage.getItem(LAST_PLAN_KEY);
+if (lastPlanKey) {
+    getCachedPlan(lastPlanKey).then(cached => {
+        if (cached && Date.now() - cached.savedAt < PLAN_MAX_AGE_MS) {
+            displayPlan(cached.data);
+        }
+    });
+}
+
+function postChat(message) {
+    // Within a session the server already has the plan, so only send the question
+    return fetch('/chat', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({
+            question: message,
+            travel_plan: currentChatSession ? '' : currentTravelPlan,
+            session_id: currentChatSession
+        }),
+    });
+}
+
+async function sendMessage() {
+    const chatInput = document.getElementById('chatInput');
+    const message = chatInput.value.trim();
+    if (!message) return;
+
+    // Clear input
+    chatInput.value = '';
+
+    // Add user message to chat
+    addMessageToChat(message, true);
+
+    if (askLive(message)) return;
+
+    try {
+        let response = await postChat(message);
+        if (response.status === 404 && currentChatSession) {
+            // Session expired on the server; start a new one from the full plan
+            currentChatSession = null;
+            response = await postChat(message);
+        }
+
+        const data = await response.json();
+        if (response.ok) {
+            // Add AI response to chat
+            currentChatSession = data.session_id || null;
+            addMessageToChat(data.response, false);
+        } else {
+            addMessageToChat("Sorry, I couldn't process your question. Please try again.", false);
+        }
+    } catch (error) {
+        addMessageToChat("Error connecting to the server. Please try again.", false);
+    }
+}
+
+function addMessageToChat(message, isUser) {
+    const chatMessages = document.getElementById('chatMessages');
+    const messageDiv = document.createElement('div');
+    messageDiv.className = `message ${isUser ? 'user-message' : 'ai-message'} ${isUser ? 'user' : 'ai'}`;
+    messageDiv.innerHTML = marked.parse(message);
+    chatMessages.appendChild(messageDiv);
+    chatMessages.scrollTop = chatMessages.scrollHeight;
+    return messageDiv;
+}
+
+// Handle Enter key in chat input
+document.getElementById('chatInput').addEventListener('keypress', (e) => {
+    if (e.key === 'Enter') {
+        sendMessage();
+    }
+});
@@ -0,0 +1,47 @@
+import unittest
+
+from answers import AnswerCache, content_words
+
+
+class AnswerCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = AnswerCache(max_entries=10)
+
+    def assertShared(self, asked, repeated):
+        self.cache.store("plan", asked, "answer")
+        self.assertEqual(self.cache.lookup("plan", repeated), "answer")
+
+    def assertNotShared(self, asked, repeated):
+        self.cache.store("plan", asked, "answer")
+        self.assertIsNone(self.cache.lookup("plan", repeated))
+
+    def test_rephrasings_share_an_answer(self):
+        self.assertShared("What's the weather like?", "what is the weather like")
+        self.assertShared("cheapest transport", "What is the cheapest transport?")
+        self.assertShared("Where should I eat on day 2?", "where should we eat on day 2")
+
+    def test_different_questions_do_not(self):
+        self.assertNotShared("Is it safe to walk at night?", "Is it unsafe to walk at night?")
+        self.assertNotShared("What should I do in the morning?", "What should I do in the evening?")
+        self.assertNotShared("Where should we eat?", "Where shouldn't we eat?")
+        self.assertNotShared("What is on day 2?", "What is on day 3?")
+
+    def test_answers_are_per_plan(self):
+        self.cache.store("plan", "cheapest transport", "answer")
+        self.assertIsNone(self.cache.lookup("other plan", "cheapest transport"))
+
+    def test_least_recently_used_is_evicted(self):
+        cache = AnswerCache(max_entries=2)
+        cache.store("plan", "day 1", "one")
+        cache.store("plan", "day 2", "two")
+        cache.lookup("plan", "day 1")
+        cache.store("plan", "day 3", "three")
+        self.assertIsNone(cache.lookup("plan", "day 2"))
+        self.assertEqual(cache.lookup("plan", "day 1"), "one")
+
+    def test_negations_are_content_words(self):
+        self.assertEqual(content_words("Where don't we eat?"), {"where", "not", "eat"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+
+from sessions import ChatSessionStore
+
+
+class StubChat:
+    def __init__(self, history=None):
+        self.history = list(history or [])
+
+    def send_message(self, question):
+        self.history += [{"role": "user", "parts": [question]}, {"role": "model", "parts": ["ok"]}]
+
+
+class BrokenStreamChat(StubChat):
+    """Mimics the SDK after a streamed reply failed part-way"""
+
+    def __init__(self, history=None):
+        self.broken = False
+        super().__init__(history)
+
+    @property
+    def history(self):
+        if self.broken:
+            raise RuntimeError("broken streaming response")
+        return self._history
+
+    @history.setter
+    def history(self, history):
+        self._history = history
+
+    def rewind(self):
+        self.broken = False
+
+
+class StubModel:
+    def start_chat(self, history=None):
+        return StubChat(history)
+
+
+class ChatSessionStoreTest(unittest.TestCase):
+    def test_history_is_capped_after_the_plan(self):
+        store = ChatSessionStore(lambda name: StubModel(), estimate_tokens=lambda text: 0)
+        session = store.create("plan", "gemini-1.5-flash")
+        session.max_turns = 2
+        for i in range(5):
+            session.chat.send_message(f"q{i}")
+            session.finish_turn()
+
+        history = session.chat.history
+        self.assertEqual(session.turns, 5)
+        self.assertEqual(len(history), 2 + 4)
+        self.assertIn("plan", history[0]["parts"][0])
+        self.assertEqual([h["parts"][0] for h in history[2::2]], ["q3", "q4"])
+
+    def test_large_plans_use_the_context_cache(self):
+        caches = []
+        store = ChatSessionStore(
+            lambda name: self.fail("plain history used"),
+            estimate_tokens=lambda text: 10 ** 6,
+            create_cache=lambda plan, ttl: caches.append(plan) or "cache-1",
+            cached_model=lambda cached_content: StubModel(),
+        )
+        session = store.create("plan", "gemini-1.5-flash")
+
+        self.assertEqual(caches, ["plan"])
+        self.assertEqual(session.cached_content, "cache-1")
+        self.assertEqual(session.chat.history, [])
+
+    def test_cache_failures_fall_back_to_history(self):
+        def fail(plan, ttl):
+            raise RuntimeError("caching unavailable")
+
+        store = ChatSessionStore(lambda name: StubModel(), estimate_tokens=lambda text: 10 ** 6, create_cache=fail)
+        session = store.create("plan", "gemini-1.5-flash")
+
+        self.assertIsNone(session.cached_content)
+        self.assertEqual(len(session.chat.history), 2)
+
+
+    def test_a_broken_stream_is_rewound(self):
+        store = ChatSessionStore(lambda name: StubModel(), estimate_tokens=lambda text: 0)
+        session = store.create("plan", "gemini-1.5-flash")
+        session.chat = BrokenStreamChat(session.chat.history)
+        session.chat.broken = True
+
+        self.assertTrue(session.discard_failed_turn())
+        self.assertEqual(len(session.chat.history), 2)
+
+    def test_an_intact_history_is_left_alone(self):
+        store = ChatSessionStore(lambda name: StubModel(), estimate_tokens=lambda text: 0)
+        session = store.create("plan", "gemini-1.5-flash")
+        session.chat.send_message("q")
+
+        self.assertTrue(session.discard_failed_turn())
+        self.assertEqual(len(session.chat.history), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, datetime
+
+logger = logging.getLogger(__name__)
+
+# Scheduler settings; the warmer only runs when CACHE_WARMER_ENABLED is set
+CACHE_WARMER_ENABLED = os.environ.get("CACHE_WARMER_ENABLED", "").lower() in ("1", "true", "yes")
+WARMER_INTERVAL_SECONDS = float(os.environ.get("WARMER_INTERVAL_SECONDS", 900))
+WARMER_TOP_N = int(os.environ.get("WARMER_TOP_N", 20))
+WARMER_MAX_CALLS = int(os.environ.get("WARMER_MAX_CALLS", 10))
+WARMER_OFF_PEAK_HOURS = os.environ.get("WARMER_OFF_PEAK_HOURS", "1-6")
+WARMER_REFRESH_MARGIN_SECONDS = float(os.environ.get("WARMER_REFRESH_MARGIN_SECONDS", 1800))
+
+ROUTE_LOG_RETENTION_DAYS = float(os.environ.get("ROUTE_LOG_RETENTION_DAYS", 30))
+ROUTE_LOG_DB_PATH = os.environ.get("ROUTE_LOG_DB_PATH") or os.environ.get("USAGE_DB_PATH", "usage.db")
+
+# Trip start date of a logged payload, NULL for payloads that have none
+_START_DATE = "(CASE WHEN json_valid(payload) THEN json_extract(payload, '$.start_date') END)"
+
+
+def parse_hours(spec):
+    """Turn "1-6" or "22-2,13" into the set of local hours it covers"""
+    hours = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = (int(h) % 24 for h in part.split("-", 1))
+            hour = start
+            while hour != end:
+                hours.add(hour)
+                hour = (hour + 1) % 24
+            hours.add(end)
+        else:
+            hours.add(int(part) % 24)
+    return hours
+
+
+class RouteLog:
+    """Counts plan requests by their normalized payload and persists them to SQLite
+
+    The persisted counts survive restarts and are the source of the top-N
+    routes the warmer refreshes. Trips that have already started are pruned,
+    since they can no longer be requested.
+    """
+
+    def __init__(self, db_path=ROUTE_LOG_DB_PATH):
+        self.db_path = db_path
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def record(self, payload):
+        with self._lock:
+            self._pending[payload] = self._pending.get(payload, 0) + 1
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS route_log (
+                payload TEXT PRIMARY KEY,
+                hits INTEGER NOT NULL,
+                last_seen REAL NOT NULL
+            )"""
+        )
+        return conn
+
+    def flush(self):
+        """Write counts accumulated since the last flush to SQLite"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.executemany(
+                """INSERT INTO route_log VALUES (?, ?, ?)
+                ON CONFLICT(payload) DO UPDATE SET
+                    hits = hits + excluded.hits,
+                    last_seen = excluded.last_seen""",
+                [(payload, hits, now) for payload, hits in pending.items()],
+            )
+            conn.execute(
+                f"DELETE FROM route_log WHERE last_seen < ? OR {_START_DATE} < ?",
+                (now - ROUTE_LOG_RETENTION_DAYS * 86400, date.today().isoformat()),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def top(self, limit):
+        """Payloads of the most requested upcoming plans, most popular first"""
+        self.flush()
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                f"""SELECT payload FROM route_log
+                WHERE {_START_DATE} IS NULL OR {_START_DATE} >= ?
+                ORDER BY hits DESC, last_seen DESC LIMIT ?""",
+                (date.today().isoformat(), limit),
+            ).fetchall()
+        finally:
+            conn.close()
+        return [row[0] for row in rows]
+
+
+class CacheWarmer:
+    """Refresh popular plans before their cache entries expire
+
+    ``warm`` is an async callable that regenerates and caches one plan from
+    its logged payload, and ``age`` returns how old the cached entry for a
+    payload is (None when missing). Each run is limited to ``max_calls``
+    regenerations. Missing plans are only generated during off-peak hours;
+    outside them the warmer just keeps already cached plans from expiring.
+    """
+
+    def __init__(self, route_log, warm, age, ttl_seconds,
+                 top_n=WARMER_TOP_N, max_calls=WARMER_MAX_CALLS,
+                 off_peak_hours=WARMER_OFF_PEAK_HOURS,
+                 refresh_margin=WARMER_REFRESH_MARGIN_SECONDS):
+        self.route_log = route_log
+        self.warm = warm
+        self.age = age
+        self.ttl_seconds = ttl_seconds
+        self.top_n = top_n
+        self.max_calls = max_calls
+        self.off_peak_hours = parse_hours(off_peak_hours)
+        self.refresh_margin = refresh_margin
+        self.last_run = None
+
+    def needs_refresh(self, payload, off_peak=True):
+        age = self.age(payload)
+        if age is None:
+            return off_peak
+        return age >= self.ttl_seconds - self.refresh_margin
+
+    async def run_once(self, off_peak=True):
+        """Warm up to ``max_calls`` of the top routes, returning how many were warmed"""
+        payloads = await asyncio.to_thread(self.route_log.top, self.top_n)
+        warmed = 0
+        for payload in payloads:
+            if warmed >= self.max_calls:
+                break
+            if not self.needs_refresh(payload, off_peak):
+                continue
+            try:
+                if await self.warm(payload):
+                    warmed += 1
+            except Exception as e:
+                logger.warning("Cache warmer stopped", extra={"error": repr(e)})
+                break
+        self.last_run = {"at": time.time(), "off_peak": off_peak, "candidates": len(payloads), "warmed": warmed}
+        logger.info("Cache warmer run finished", extra=self.last_run)
+        return warmed
+
+    async def run_forever(self, interval=WARMER_INTERVAL_SECONDS):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.run_once(off_peak=datetime.now().hour in self.off_peak_hours)
+            except Exception:
+                logger.exception("Error warming cache")